@@ -0,0 +1,319 @@
+import asyncio
+import time
+import zlib
+from datetime import datetime
+from urllib.parse import urlparse
+import aiohttp
+import os
+from database import init_database, close_connections, get_all_stats, CheckWriteBuffer
+from sites_config import load_sites, get_site_config, registry
+from http_client import get_async_session, close_async_session, resolved_address
+from checker import (BROWSER_HEADERS, CHECK_INTERVAL, MAX_BODY_BYTES, STREAM_CHUNK_SIZE, get_body_scanner, get_body_decoder, content_error, SITES_RELOAD_INTERVAL, ALERT_CORRELATION_WINDOW, PER_HOST_CONCURRENCY,
+                     WRITE_BUFFER_SIZE, WRITE_BUFFER_MAX_AGE, handle_check_result, evaluate_check_result, warm_site_state,
+                     dispatch_sweep_alerts, refresh_sites, alerts)
+from scheduler import SiteScheduler, CHECK_MIN_INTERVAL
+
+# ===== ASYNC CONCURRENCY =====
+ASYNC_MAX_CONCURRENT_CHECKS = int(os.getenv('ASYNC_MAX_CONCURRENT_CHECKS', 500))  # Probes in flight on the loop
+
+_host_semaphores = {}
+
+write_buffer = CheckWriteBuffer(max_size=WRITE_BUFFER_SIZE, max_age=WRITE_BUFFER_MAX_AGE)
+
+def get_host_semaphore(url):
+    """Get the asyncio semaphore limiting parallel probes against the host of a URL"""
+    host = urlparse(url).hostname or url
+    
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+        _host_semaphores[host] = semaphore
+    
+    return semaphore
+
+async def read_body_async(response, max_bytes, scanner=None):
+    """Async version of checker.read_body
+    
+    The shared session leaves bodies compressed; they are decompressed for
+    the scanner the same way, and max_bytes counts the same bytes.
+    """
+    decoder = get_body_decoder(response.headers, max_bytes, scanner)
+    received = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        try:
+            chunk = decoder.decode(chunk) if decoder else chunk[:max_bytes - received]
+        except zlib.error:
+            response.close()
+            raise
+        if scanner:
+            scanner.feed(chunk)
+        received += len(chunk)
+        if received >= max_bytes:
+            # Stopped before the end: drop the connection rather than draining it
+            response.close()
+            break
+    return received
+
+async def probe_website_async(url, max_retries=None, retry_delay=2):
+    """Async version of checker.probe_website (no alerting)"""
+    site = get_site_config(url)
+    max_retries = max_retries or site.retries
+    session = await get_async_session(ASYNC_MAX_CONCURRENT_CHECKS, headers=BROWSER_HEADERS)
+    timeout = aiohttp.ClientTimeout(total=site.timeout)
+    host = urlparse(url).hostname or url
+    last_error = None
+    
+    # Try multiple times before giving up
+    for attempt in range(max_retries):
+        try:
+            trace_ctx = {}
+            started = time.perf_counter()
+            scanner = get_body_scanner(site)
+            # Only ask for encodings read_body_async can decode when the body is checked
+            headers = {'Accept-Encoding': 'gzip, deflate', **site.headers} if scanner else site.headers
+            request = session.request(
+                site.method, url,
+                timeout=timeout,
+                headers=headers,
+                allow_redirects=site.follow_redirects,
+                trace_request_ctx=trace_ctx
+            )
+            async with request as response:
+                headers_received = time.perf_counter()
+                # Same meaning as requests' response.elapsed: time until headers arrived
+                response_time = headers_received - started
+                status_code = response.status
+                peer = response.connection.transport.get_extra_info('peername') if response.connection else None
+                # Stream the body (up to the cap) so the download phase is timed
+                try:
+                    received = await read_body_async(response, site.max_body_bytes or MAX_BODY_BYTES, scanner)
+                    decode_error = None
+                except zlib.error as e:
+                    received = 0
+                    decode_error = f"Couldn't decompress the {response.headers.get('Content-Encoding')} body: {e}"
+                finished = time.perf_counter()
+            
+            # aiohttp reports DNS separately but folds the TLS handshake into connection setup
+            dns_time = trace_ctx.get('dns_time', 0.0)
+            setup_time = trace_ctx.get('setup_time', 0.0)
+            timing = {
+                'dns_time': dns_time,
+                'connect_time': max(setup_time - dns_time, 0.0),
+                'tls_time': None,
+                'ttfb': max(response_time - setup_time, 0.0),
+                'download_time': finished - headers_received,
+                # No new socket means a warm keep-alive connection was reused
+                'reused_connection': trace_ctx.get('connections_opened', 0) == 0,
+                # A body that arrived with the headers releases the connection early
+                'remote_ip': peer[0] if peer else resolved_address(host)
+            }
+            
+            # Expected status but the page doesn't say what it should is a warning too
+            error = (decode_error or content_error(scanner, received)) if status_code in site.expected_status else None
+            
+            if status_code in site.expected_status and not error:
+                print(f"✅ {url} is UP - Response time: {response_time:.6f}s")
+                return {
+                    "url": url,
+                    "status": "up",
+                    "response_time": response_time,
+                    "status_code": status_code,
+                    **timing,
+                    "timestamp": datetime.now()
+                }
+            
+            # Unexpected status code or content - might be temporary, retry
+            problem = error or f"returned {status_code}"
+            if attempt < max_retries - 1:
+                print(f"⚠️ {url} {problem}, retrying ({attempt + 1}/{max_retries})...")
+                await asyncio.sleep(retry_delay)
+                continue
+            
+            # Still failing after retries
+            print(f"⚠️ {url} {problem} (after {max_retries} attempts)")
+            return {
+                "url": url,
+                "status": "warning",
+                "response_time": response_time,
+                "status_code": status_code,
+                "error": error,
+                **timing,
+                "timestamp": datetime.now()
+            }
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # aiohttp timeouts carry no message, so name them like requests does
+            last_error = e if str(e) else f"{type(e).__name__}: request timed out"
+            
+            # Retry on connection errors
+            if attempt < max_retries - 1:
+                print(f"❌ {url} failed (attempt {attempt + 1}/{max_retries}): {str(last_error)[:80]}")
+                print(f"   🔄 Retrying in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay)
+                continue
+    
+    # All retries failed
+    print(f"❌ {url} is DOWN after {max_retries} attempts - Error: {str(last_error)[:80]}")
+    return {
+        "url": url,
+        "status": "down",
+        "response_time": None,
+        "error": str(last_error),
+        # Whatever the host resolved to, so failures to connect still group by network
+        "remote_ip": resolved_address(host),
+        "timestamp": datetime.now()
+    }
+
+async def check_website_async(url, max_retries=None, retry_delay=2):
+    """Async version of checker.check_website"""
+    await asyncio.to_thread(warm_site_state, [url])
+    result = await probe_website_async(url, max_retries=max_retries, retry_delay=retry_delay)
+    
+    # Alerting and persistence use blocking I/O, so keep them off the event loop
+    await asyncio.to_thread(handle_check_result, result, max_retries)
+    # Usually just queues the result; a threshold flush writes the batch
+    await asyncio.to_thread(write_buffer.add, result)
+    
+    return result
+
+async def check_all_sites_async(sites=None):
+    """Check all monitored sites on the event loop"""
+    if sites is None:
+        sites = load_sites()
+    
+    print(f"\n{'='*50}")
+    print(f"🔍 Checking sites at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (async)")
+    print(f"{'='*50}")
+    
+    await asyncio.to_thread(warm_site_state, sites)
+    
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENT_CHECKS)
+    
+    async def check_one(url):
+        async with semaphore, get_host_semaphore(url):
+            result = await probe_website_async(url)
+        await asyncio.to_thread(write_buffer.add, result)
+        return result
+    
+    # Results come back in the same order as sites
+    results = await asyncio.gather(*(check_one(url) for url in sites))
+    
+    # One transaction for the rest of the sweep (a failed write doesn't change the results)
+    await asyncio.to_thread(write_buffer.try_flush)
+    
+    # Alert on the whole sweep at once so shared failures become one incident
+    pending_alerts = [evaluate_check_result(result) for result in results]
+    dispatch_sweep_alerts([pending for pending in pending_alerts if pending])
+    
+    print(f"\n⏱  Checked {len(results)} sites in {time.monotonic() - started:.1f}s (async)")
+    
+    return results
+
+async def run_monitor_async():
+    """Main monitoring loop running every check on one event loop when the scheduler says it is due"""
+    await asyncio.to_thread(init_database)
+    
+    scheduler = SiteScheduler(CHECK_INTERVAL)
+    watcher = registry.watch()
+    sites = load_sites()
+    
+    print("🚀 Site Monitor Started! (async mode)")
+    print(f"Monitoring {len(sites)} sites")
+    print(f"Check interval: {CHECK_INTERVAL} seconds ({CHECK_INTERVAL/60} minutes), {CHECK_MIN_INTERVAL:.0f}s while failing")
+    print(f"Concurrency: {ASYNC_MAX_CONCURRENT_CHECKS} probes, {PER_HOST_CONCURRENCY} per host")
+    print("\nPress Ctrl+C to stop\n")
+    
+    semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENT_CHECKS)
+    
+    async def check_one(url):
+        async with semaphore, get_host_semaphore(url):
+            result = await probe_website_async(url)
+        await asyncio.to_thread(write_buffer.add, result)
+        return result
+    
+    in_flight = {}
+    pending_alerts = []
+    next_reload = time.monotonic()
+    next_dispatch = time.monotonic() + ALERT_CORRELATION_WINDOW
+    
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_reload:
+                # Pick up sites added or removed since the last look
+                await asyncio.to_thread(refresh_sites, scheduler, watcher)
+                next_reload = now + SITES_RELOAD_INTERVAL
+            
+            for url in scheduler.pop_due(now):
+                in_flight[asyncio.create_task(check_one(url))] = url
+            
+            # Wait until the next check is due or a running one finishes
+            wakeups = [next_reload - now, next_dispatch - now, scheduler.seconds_until_next(now)]
+            timeout = max(min(wakeup for wakeup in wakeups if wakeup is not None), 0)
+            if in_flight:
+                done, _ = await asyncio.wait(in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(timeout)
+                done = ()
+            
+            for task in done:
+                url = in_flight.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    print(f"❌ Checking {url} failed unexpectedly: {e}")
+                    scheduler.record(url, 'down')
+                    continue
+                
+                scheduler.record(url, result['status'])
+                pending = evaluate_check_result(result)
+                if pending:
+                    pending_alerts.append(pending)
+            
+            await asyncio.to_thread(write_buffer.flush_if_due)
+            
+            # Alert on everything that finished in the window at once so
+            # shared failures become one incident
+            if time.monotonic() >= next_dispatch:
+                if pending_alerts:
+                    dispatch_sweep_alerts(pending_alerts)
+                    pending_alerts = []
+                next_dispatch = time.monotonic() + ALERT_CORRELATION_WINDOW
+    finally:
+        for task in in_flight:
+            task.cancel()
+        # Alerts still waiting for correlation
+        dispatch_sweep_alerts(pending_alerts)
+        await close_async_session()
+
+def main():
+    """Run the async monitor until Ctrl+C, then show final statistics"""
+    try:
+        asyncio.run(run_monitor_async())
+    except KeyboardInterrupt:
+        print("\n\n👋 Monitor stopped by user")
+        # Send alerts still waiting in the digest window
+        alerts.close()
+        
+        # Don't lose results still waiting in the buffer
+        saved = write_buffer.flush()
+        if saved:
+            print(f"💾 Saved {saved} buffered results")
+        
+        # Show stats before exiting
+        print("\n📊 Final Statistics:")
+        sites = load_sites()
+        all_stats = get_all_stats(sites)
+        for site in sites:
+            stats = all_stats[site]
+            print(f"\n{site}")
+            print(f"  Total checks: {stats['total_checks']}")
+            print(f"  Uptime: {stats['uptime_percentage']:.2f}%")
+            print(f"  Avg response: {stats['avg_response_time']:.3f}s")
+        
+        close_connections()
+
+# Run it
+if __name__ == "__main__":
+    main()
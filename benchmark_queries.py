@@ -0,0 +1,140 @@
+"""Benchmark the hot read queries before and after the schema migrations.
+
+Builds a throwaway database in the original checks layout, migrates it in
+place with init_database(), then times each query with the migration's
+indexes dropped and again with them recreated.
+
+    python benchmark_queries.py --sites 200 --checks-per-site 2000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+def create_legacy_database(path, sites, checks_per_site):
+    """Create checks as it looked before any migration and fill it with synthetic checks"""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            status TEXT NOT NULL,
+            response_time REAL,
+            status_code INTEGER,
+            error TEXT,
+            timestamp DATETIME NOT NULL
+        )
+    ''')
+    
+    start = datetime.now() - timedelta(minutes=5 * checks_per_site)
+    rng = random.Random(42)
+    
+    # Insert in time order, one sweep over every site per 5 minutes, like the checker does
+    for i in range(checks_per_site):
+        timestamp = start + timedelta(minutes=5 * i)
+        rows = []
+        for url in sites:
+            status = 'up' if rng.random() > 0.02 else rng.choice(['down', 'warning'])
+            rows.append((
+                url,
+                status,
+                rng.uniform(0.05, 1.5) if status != 'down' else None,
+                200 if status == 'up' else (503 if status == 'warning' else None),
+                'Connection refused' if status == 'down' else None,
+                timestamp
+            ))
+        conn.executemany('''
+            INSERT INTO checks (url, status, response_time, status_code, error, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+    
+    conn.commit()
+    conn.close()
+
+def drop_indexes(path):
+    """Drop every secondary index, returning the SQL needed to recreate them"""
+    conn = sqlite3.connect(path)
+    indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    conn.commit()
+    conn.close()
+    return [sql for _, sql in indexes]
+
+def create_indexes(path, statements):
+    """Recreate indexes from their SQL"""
+    conn = sqlite3.connect(path)
+    for sql in statements:
+        conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+def time_call(func, *args, repeat=5, **kwargs):
+    """Best-of-N wall time of a call in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_queries(sites):
+    """Time each hot query against the current database"""
+    from database import get_recent_checks, get_stats, get_all_stats, get_checks_by_date_range, get_all_incidents
+    from web_dashboard import get_site_history
+    
+    url = sites[len(sites) // 2]
+    end = datetime.now()
+    start = end - timedelta(days=1)
+    
+    return {
+        'get_recent_checks': time_call(get_recent_checks, url, limit=10),
+        'get_stats': time_call(get_stats, url),
+        'get_all_stats (all sites)': time_call(get_all_stats, sites, repeat=3),
+        'get_checks_by_date_range': time_call(get_checks_by_date_range, url, start, end),
+        'get_site_history': time_call(get_site_history, url, hours=24),
+        'get_all_incidents (24h)': time_call(get_all_incidents, hours=24, repeat=3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sites', type=int, default=100, help='number of synthetic sites')
+    parser.add_argument('--checks-per-site', type=int, default=2000, help='checks stored per site')
+    args = parser.parse_args()
+    
+    sites = [f"https://site-{i}.example.com" for i in range(args.sites)]
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        # Every module resolves monitor.db / sites.json relative to the working directory
+        os.chdir(workdir)
+        with open('sites.json', 'w') as f:
+            json.dump(sites, f)
+        
+        import database
+        
+        print(f"📦 Building {args.sites * args.checks_per_site:,} checks for {args.sites} sites...")
+        create_legacy_database(database.DB_FILE, sites, args.checks_per_site)
+        
+        started = time.perf_counter()
+        database.init_database()
+        print(f"🔧 Migration took {time.perf_counter() - started:.2f}s")
+        
+        index_statements = drop_indexes(database.DB_FILE)
+        before = run_queries(sites)
+        
+        create_indexes(database.DB_FILE, index_statements)
+        after = run_queries(sites)
+    
+    print(f"\n{'Query':<30}{'Before (ms)':>14}{'After (ms)':>14}{'Speedup':>10}")
+    print('-' * 68)
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f"{name:<30}{before[name]:>14.2f}{after[name]:>14.2f}{speedup:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
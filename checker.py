@@ -1,81 +1,303 @@
+import re
 import requests
 import time
+import threading
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from database import init_database, save_check, get_stats, get_recent_checks
-from sites_config import load_sites
-from email_config import send_email_alert, format_email_alert
+from urllib.parse import urlparse
+from http_client import get_session, reset_connection_tracking, connections_opened, get_phase_timings, get_remote_ip, close_session
+from database import init_database, close_connections, CheckWriteBuffer, get_all_stats, sync_sites
+from site_state import SiteStateStore
+from sites_config import load_sites, get_site_config, registry
+from email_config import format_email_alert
+from notifier import AlertDispatcher
+from scheduler import SiteScheduler, CHECK_MIN_INTERVAL
+from correlation import ALERT_STORM_THRESHOLD, MAX_SITES_LISTED, group_failures, describe_key, classify_error
 import os
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# ===== TELEGRAM CONFIG =====
-TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
-
 # ===== SITES TO MONITOR =====
 SITES_TO_MONITOR = load_sites()
 
 CHECK_INTERVAL = 300  # Check every 5 minutes (300 seconds)
+SITES_RELOAD_INTERVAL = 5  # Seconds between checks of sites.json for changes
 
-def send_telegram_alert(message):
-    """Send alert via Telegram"""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    data = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": message,
-        "parse_mode": "HTML"
-    }
+# ===== CONCURRENCY =====
+MAX_CONCURRENT_CHECKS = int(os.getenv('MAX_CONCURRENT_CHECKS', 20))  # Sites checked in parallel
+PER_HOST_CONCURRENCY = int(os.getenv('PER_HOST_CONCURRENCY', 2))  # Be polite to hosts serving several sites
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+# ===== RESPONSE BODIES =====
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', 1048576))  # Most of a body read per probe unless the site sets its own cap
+STREAM_CHUNK_SIZE = 65536  # Bytes read (and scanned) at a time
+REGEX_WINDOW = 4096  # Longest expect_regex match that may span two chunks
+
+# ===== WRITE BUFFER =====
+WRITE_BUFFER_SIZE = int(os.getenv('WRITE_BUFFER_SIZE', 500))  # Results per database transaction
+WRITE_BUFFER_MAX_AGE = float(os.getenv('WRITE_BUFFER_MAX_AGE', 10))  # Seconds a result may wait unsaved
+
+write_buffer = CheckWriteBuffer(max_size=WRITE_BUFFER_SIZE, max_age=WRITE_BUFFER_MAX_AGE)
+
+# ===== RECENT STATE =====
+SITE_HISTORY_SIZE = int(os.getenv('SITE_HISTORY_SIZE', 8))  # Results per site kept in memory for alerting
+
+site_state = SiteStateStore(history=SITE_HISTORY_SIZE)
+
+# Telegram and email alerts go out from a background thread
+alerts = AlertDispatcher()
+
+ALERT_CORRELATION_WINDOW = float(os.getenv('ALERT_CORRELATION_WINDOW', 30))  # Seconds of results correlated before alerting
+
+# An alert a check result calls for, before correlation with the rest of the sweep
+PendingAlert = namedtuple('PendingAlert', ['kind', 'result', 'message', 'email_subject', 'email_body'])
+
+# Headers to mimic a real browser
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+class BodyScanner:
+    """Looks for a site's expect_text and/or expect_regex in a body fed chunk by chunk
     
-    try:
-        requests.post(url, data=data)
-        print("📱 Telegram alert sent")
-    except Exception as e:
-        print(f"Failed to send Telegram alert: {e}")
+    Only a short tail of what was already seen is kept, so a match spanning
+    two chunks is still found without buffering the page. A regex match
+    can be at most REGEX_WINDOW bytes long.
+    """
+    
+    def __init__(self, text=None, pattern=None):
+        self._text = text.encode() if text else None
+        self._pattern = re.compile(pattern.encode()) if pattern else None
+        self._keep = max(len(self._text) - 1 if self._text else 0, REGEX_WINDOW if self._pattern else 0)
+        self._tail = b''
+        self.missing = [description for description in (
+            f'text "{text}"' if text else None,
+            f'pattern /{pattern}/' if pattern else None
+        ) if description]
+    
+    @property
+    def matched(self):
+        return self._text is None and self._pattern is None
+    
+    def feed(self, chunk):
+        """Scan the next chunk of the body"""
+        if self.matched:
+            return
+        
+        data = self._tail + chunk
+        if self._text is not None and self._text in data:
+            self._text = None
+            self.missing = [m for m in self.missing if not m.startswith('text')]
+        if self._pattern is not None and self._pattern.search(data):
+            self._pattern = None
+            self.missing = [m for m in self.missing if not m.startswith('pattern')]
+        self._tail = data[-self._keep:] if self._keep else b''
 
-def check_website(url, max_retries=3, retry_delay=2):
-    """Check if a website is responding with retry logic"""
-    # Headers to mimic a real browser
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1'
-    }
+def get_body_scanner(site):
+    """BodyScanner for a site's content assertion (None if it has none)"""
+    if site.expect_text or site.expect_regex:
+        return BodyScanner(site.expect_text, site.expect_regex)
+    return None
+
+class BodyDecoder:
+    """Decompresses a gzip or deflate body chunk by chunk, producing at most max_bytes
+    
+    Output past the budget is never inflated, so a small compressed body
+    can't expand without limit. Raises zlib.error for a corrupt body.
+    """
+    
+    def __init__(self, max_bytes):
+        # wbits + 32 accepts both gzip and zlib headers
+        self._decoder = zlib.decompressobj(zlib.MAX_WBITS + 32)
+        self._started = False
+        self.remaining = max_bytes
+    
+    def decode(self, chunk):
+        """Decompressed bytes of the next chunk (empty once the budget is used up)"""
+        # max_length=0 would mean no limit
+        if self.remaining <= 0:
+            return b''
+        try:
+            data = self._decoder.decompress(chunk, self.remaining)
+        except zlib.error:
+            if self._started:
+                raise
+            # Some servers send deflate bodies without the zlib header
+            self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self._decoder.decompress(chunk, self.remaining)
+        self._started = True
+        self.remaining -= len(data)
+        return data
+
+def get_body_decoder(headers, max_bytes, scanner):
+    """BodyDecoder for a compressed body the scanner needs to read (None if it can read it as is)"""
+    if scanner and headers.get('Content-Encoding', '').lower() in ('gzip', 'deflate'):
+        return BodyDecoder(max_bytes)
+    return None
+
+def read_body(response, max_bytes, scanner=None):
+    """Stream a response body without keeping it, stopping after max_bytes
     
+    Chunks are passed to the scanner (if any) as they arrive, decompressed
+    for it if need be. max_bytes counts the body as the scanner sees it
+    (decompressed; as received when there is no scanner), and the scanner
+    never gets more than that. Stopping early closes the connection instead
+    of returning it to the pool, which is still much cheaper than
+    downloading a large page. Returns the number of body bytes read. Raises
+    zlib.error if the body can't be decompressed.
+    """
+    decoder = get_body_decoder(response.headers, max_bytes, scanner)
+    received = 0
+    # Read as sent: decompression is left to the decoder, which respects the cap
+    for chunk in response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False):
+        try:
+            chunk = decoder.decode(chunk) if decoder else chunk[:max_bytes - received]
+        except zlib.error:
+            response.close()
+            raise
+        if scanner:
+            scanner.feed(chunk)
+        received += len(chunk)
+        if received >= max_bytes:
+            response.close()
+            break
+    return received
+
+def content_error(scanner, received):
+    """Why a content assertion failed (None if it passed or there is none)"""
+    if scanner is None or scanner.matched:
+        return None
+    return f"Expected {' and '.join(scanner.missing)} not found in the first {received:,} bytes"
+
+def probe_website(url, max_retries=None, retry_delay=2):
+    """Request a URL as its site config says, with retry logic, and classify the outcome (no alerting)"""
+    site = get_site_config(url)
+    max_retries = max_retries or site.retries
+    headers = {**BROWSER_HEADERS, **site.headers}
+    if site.expect_text or site.expect_regex:
+        # Only ask for encodings the body can be decoded from for the content check (no brotli)
+        headers = {**BROWSER_HEADERS, 'Accept-Encoding': 'gzip, deflate', **site.headers}
     last_error = None
-    last_status_code = None
-    last_response_time = None
+    last_remote_ip = None
     
     # Try multiple times before giving up
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=5, headers=headers, allow_redirects=True)
+            reset_connection_tracking()
+            started = time.perf_counter()
+            response = get_session().request(
+                site.method, url,
+                timeout=site.timeout,
+                headers=headers,
+                allow_redirects=site.follow_redirects,
+                stream=True
+            )
+            headers_received = time.perf_counter()
+            remote_ip = getattr(response.raw.connection, 'remote_ip', None) or get_remote_ip()
+            # Stream the body (up to the cap) so the download phase is timed
+            scanner = get_body_scanner(site)
+            try:
+                received = read_body(response, site.max_body_bytes or MAX_BODY_BYTES, scanner)
+                decode_error = None
+            except zlib.error as e:
+                received = 0
+                decode_error = f"Couldn't decompress the {response.headers.get('Content-Encoding')} body: {e}"
+            finished = time.perf_counter()
             response_time = response.elapsed.total_seconds()
-            last_response_time = response_time
             
-            if response.status_code == 200:
+            # Break the request down into DNS, connect, TLS, time to first byte and download
+            timing = get_phase_timings()
+            timing['ttfb'] = max(headers_received - started - sum(timing.values()), 0.0)
+            timing['download_time'] = finished - headers_received
+            # No new socket means a warm keep-alive connection was reused
+            timing['reused_connection'] = connections_opened() == 0
+            timing['remote_ip'] = remote_ip
+            
+            # Expected status but the page doesn't say what it should is a warning too
+            error = (decode_error or content_error(scanner, received)) if response.status_code in site.expected_status else None
+            
+            if response.status_code in site.expected_status and not error:
                 print(f"✅ {url} is UP - Response time: {response_time}s")
-                
-                # Check if this is a recovery (was down before, now up)
-                recent = get_recent_checks(url, limit=3)
-                was_down = any(check[1] in ['down', 'warning'] for check in recent) if recent else False
-                
-                result = {
+                return {
                     "url": url,
                     "status": "up",
                     "response_time": response_time,
                     "status_code": response.status_code,
+                    **timing,
                     "timestamp": datetime.now()
                 }
-                
-                # Send recovery alert if site was previously down
-                if was_down:
-                    stats = get_stats(url)
-                    recovery_message = f"""✅ <b>RECOVERY: Site Back Online</b>
+            
+            # Unexpected status code or content - might be temporary, retry
+            problem = error or f"returned {response.status_code}"
+            if attempt < max_retries - 1:
+                print(f"⚠️ {url} {problem}, retrying ({attempt + 1}/{max_retries})...")
+                time.sleep(retry_delay)
+                continue
+            
+            # Still failing after retries
+            print(f"⚠️ {url} {problem} (after {max_retries} attempts)")
+            return {
+                "url": url,
+                "status": "warning",
+                "response_time": response_time,
+                "status_code": response.status_code,
+                "error": error,
+                **timing,
+                "timestamp": datetime.now()
+            }
+            
+        except requests.exceptions.RequestException as e:
+            last_error = e
+            # The server it failed to reach, when DNS got that far (see correlation.correlation_keys)
+            last_remote_ip = get_remote_ip()
+            
+            # Retry on connection errors
+            if attempt < max_retries - 1:
+                print(f"❌ {url} failed (attempt {attempt + 1}/{max_retries}): {str(e)[:80]}")
+                print(f"   🔄 Retrying in {retry_delay} seconds...")
+                time.sleep(retry_delay)
+                continue
+    
+    # All retries failed
+    print(f"❌ {url} is DOWN after {max_retries} attempts - Error: {str(last_error)[:80]}")
+    return {
+        "url": url,
+        "status": "down",
+        "response_time": None,
+        "error": str(last_error),
+        "remote_ip": last_remote_ip,
+        "timestamp": datetime.now()
+    }
+
+def evaluate_check_result(result, max_retries=None):
+    """Record a check result and build the recovery/warning/down alert it calls for (or None)"""
+    url = result['url']
+    max_retries = max_retries or get_site_config(url).retries
+    
+    # Recent history comes from memory; this also records the new result
+    previous = site_state.record(result)
+    stats = {'uptime_percentage': previous.uptime_percentage, 'total_checks': previous.total_checks}
+    
+    if result['status'] == 'up':
+        response_time = result['response_time']
+        
+        # Check if this is a recovery (was down before, now up)
+        was_down = any(status in ['down', 'warning'] for status in previous.recent[:3])
+        
+        # Send recovery alert if site was previously down
+        if was_down:
+            recovery_message = f"""✅ <b>RECOVERY: Site Back Online</b>
 
 🌐 <b>Site:</b> {url}
 ⏱ <b>Response Time:</b> {response_time:.2f}s
@@ -84,56 +306,45 @@ def check_website(url, max_retries=3, retry_delay=2):
 📊 <b>Overall Uptime:</b> {stats['uptime_percentage']:.1f}%
 
 The site is responding normally again."""
-                    
-                    send_telegram_alert(recovery_message)
-                    
-                    email_subject = f"✅ RECOVERY: {url} is back online"
-                    email_body = f"""
-                    <html>
-                    <body style="font-family: Arial, sans-serif; padding: 20px;">
-                        <div style="background: #10b981; color: white; padding: 20px; border-radius: 10px;">
-                            <h2>✅ Site Recovered</h2>
-                            <p><strong>{url}</strong> is back online!</p>
-                        </div>
-                        <div style="margin-top: 20px; padding: 15px; background: #f9fafb; border-radius: 8px;">
-                            <p><strong>Response Time:</strong> {response_time:.2f}s</p>
-                            <p><strong>Overall Uptime:</strong> {stats['uptime_percentage']:.1f}%</p>
-                            <p><strong>Time:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                        </div>
-                    </body>
-                    </html>
-                    """
-                    send_email_alert(email_subject, email_body)
-                
-                return result
-                
-            else:
-                # Non-200 status code - might be temporary, retry
-                last_status_code = response.status_code
-                
-                if attempt < max_retries - 1:
-                    print(f"⚠️ {url} returned {response.status_code}, retrying ({attempt + 1}/{max_retries})...")
-                    time.sleep(retry_delay)
-                    continue
-                
-                # Still failing after retries
-                print(f"⚠️ {url} returned status code: {response.status_code} (after {max_retries} attempts)")
-                
-                stats = get_stats(url)
-                recent = get_recent_checks(url, limit=3)
-                consecutive_failures = sum(1 for check in recent if check[1] != "up") if recent else 0
-                
-                # DEBUG
-                print(f"   🐛 DEBUG: recent checks = {len(recent) if recent else 0}")
-                print(f"   🐛 DEBUG: consecutive_failures = {consecutive_failures}")
-                
-                # Only alert if 2+ consecutive failures (this would be the 2nd+ failure)
-                if consecutive_failures >= 1:
-                    message = f"""⚠️ <b>WARNING: Unusual Status Code</b>
+            
+            email_subject = f"✅ RECOVERY: {url} is back online"
+            email_body = f"""
+            <html>
+            <body style="font-family: Arial, sans-serif; padding: 20px;">
+                <div style="background: #10b981; color: white; padding: 20px; border-radius: 10px;">
+                    <h2>✅ Site Recovered</h2>
+                    <p><strong>{url}</strong> is back online!</p>
+                </div>
+                <div style="margin-top: 20px; padding: 15px; background: #f9fafb; border-radius: 8px;">
+                    <p><strong>Response Time:</strong> {response_time:.2f}s</p>
+                    <p><strong>Overall Uptime:</strong> {stats['uptime_percentage']:.1f}%</p>
+                    <p><strong>Time:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+                </div>
+            </body>
+            </html>
+            """
+            return PendingAlert('recovery', result, recovery_message, email_subject, email_body)
+        
+        return None
+    
+    consecutive_failures = previous.failure_streak
+    
+    # DEBUG
+    print(f"   🐛 DEBUG: recent checks = {len(previous.recent)}")
+    print(f"   🐛 DEBUG: consecutive_failures = {consecutive_failures}")
+    
+    # Only alert if 2+ consecutive failures (this would be the 2nd+ failure)
+    if consecutive_failures < 1:
+        print(f"   ⏸️  Not alerting yet - this is the first failure (need 2+ consecutive)")
+        return None
+    
+    if result['status'] == 'warning' and result.get('error'):
+        message = f"""⚠️ <b>WARNING: Content Check Failed</b>
 
 🌐 <b>Site:</b> {url}
-📊 <b>Status Code:</b> {response.status_code}
-⏱ <b>Response Time:</b> {response_time:.2f}s
+🔍 <b>Problem:</b> {result['error'][:200]}
+📊 <b>Status Code:</b> {result['status_code']}
+⏱ <b>Response Time:</b> {result['response_time']:.2f}s
 🕐 <b>Time:</b> {datetime.now().strftime('%H:%M:%S')}
 🔄 <b>Retries:</b> {max_retries} attempts made
 
@@ -141,57 +352,44 @@ The site is responding normally again."""
    • Uptime: {stats['uptime_percentage']:.1f}%
    • Consecutive failures: {consecutive_failures + 1}
 
-This is <b>not a complete failure</b>, but the site returned an error code after multiple attempts."""
-                    
-                    send_telegram_alert(message)
-                    
-                    email_subject, email_body = format_email_alert(
-                        url, 
-                        status_code=response.status_code, 
-                        stats={'uptime': stats['uptime_percentage'], 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-                    )
-                    send_email_alert(email_subject, email_body)
-                else:
-                    print(f"   ⏸️  Not alerting yet - this is the first failure (need 2+ consecutive)")
-                
-                return {
-                    "url": url,
-                    "status": "warning",
-                    "response_time": response_time,
-                    "status_code": response.status_code,
-                    "timestamp": datetime.now()
-                }
-                
-        except requests.exceptions.RequestException as e:
-            last_error = e
-            
-            # Retry on connection errors
-            if attempt < max_retries - 1:
-                print(f"❌ {url} failed (attempt {attempt + 1}/{max_retries}): {str(e)[:80]}")
-                print(f"   🔄 Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                continue
-    
-    # All retries failed
-    print(f"❌ {url} is DOWN after {max_retries} attempts - Error: {str(last_error)[:80]}")
+The site responds, but the page doesn't contain what it should."""
+        
+        email_subject, email_body = format_email_alert(
+            url, 
+            status_code=result['status_code'], 
+            stats={'uptime': stats['uptime_percentage'], 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')},
+            content_error=result['error']
+        )
+        return PendingAlert('warning', result, message, email_subject, email_body)
     
-    stats = get_stats(url)
-    recent = get_recent_checks(url, limit=3)
-    consecutive_failures = sum(1 for check in recent if check[1] != "up") if recent else 0
+    if result['status'] == 'warning':
+        message = f"""⚠️ <b>WARNING: Unusual Status Code</b>
+
+🌐 <b>Site:</b> {url}
+📊 <b>Status Code:</b> {result['status_code']}
+⏱ <b>Response Time:</b> {result['response_time']:.2f}s
+🕐 <b>Time:</b> {datetime.now().strftime('%H:%M:%S')}
+🔄 <b>Retries:</b> {max_retries} attempts made
+
+📈 <b>Recent Performance:</b>
+   • Uptime: {stats['uptime_percentage']:.1f}%
+   • Consecutive failures: {consecutive_failures + 1}
+
+This is <b>not a complete failure</b>, but the site returned an error code after multiple attempts."""
+        
+        email_subject, email_body = format_email_alert(
+            url, 
+            status_code=result['status_code'], 
+            stats={'uptime': stats['uptime_percentage'], 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        )
+        return PendingAlert('warning', result, message, email_subject, email_body)
     
-    # DEBUG
-    print(f"   🐛 DEBUG: recent checks = {len(recent) if recent else 0}")
-    print(f"   🐛 DEBUG: consecutive_failures = {consecutive_failures}")
+    recent_failures = sum(1 for status in previous.recent[:5] if status != "up")
     
-    # Only alert if 2+ consecutive failures (this would be the 2nd+ failure)
-    if consecutive_failures >= 1:
-        recent_checks = get_recent_checks(url, limit=5)
-        recent_failures = sum(1 for check in recent_checks if check[1] != "up") if recent_checks else 0
-        
-        message = f"""🚨 <b>ALERT: Site Down</b>
+    message = f"""🚨 <b>ALERT: Site Down</b>
 
 🌐 <b>Site:</b> {url}
-❌ <b>Error:</b> {str(last_error)[:100]}
+❌ <b>Error:</b> {result['error'][:100]}
 🕐 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 🔄 <b>Retries:</b> {max_retries} attempts made
 
@@ -204,77 +402,311 @@ This is <b>not a complete failure</b>, but the site returned an error code after
 {'🔴 <b>RECURRING ISSUE</b>' if recent_failures >= 2 else '⚡ Confirmed failure after retries'}
 
 ━━━━━━━━━━━━━━━━━━━━
-Monitor will check again in {CHECK_INTERVAL//60} minutes."""
-        
-        send_telegram_alert(message)
-        
-        email_subject, email_body = format_email_alert(
-            url, 
-            error=str(last_error), 
-            stats={'uptime': stats['uptime_percentage'], 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        )
-        send_email_alert(email_subject, email_body)
+Monitor will check again in {min(CHECK_MIN_INTERVAL, CHECK_INTERVAL)/60:g} minutes."""
+    
+    email_subject, email_body = format_email_alert(
+        url, 
+        error=result['error'], 
+        stats={'uptime': stats['uptime_percentage'], 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+    )
+    return PendingAlert('down', result, message, email_subject, email_body)
+
+def warm_site_state(urls):
+    """Load saved history into site_state for any of urls it hasn't seen yet
+    
+    Call before the new results are saved, so they are not counted twice.
+    """
+    new_sites = [url for url in urls if url not in site_state]
+    if new_sites:
+        # One pass over every active site when starting with all of them
+        site_state.warm(None if not site_state and len(new_sites) == len(SITES_TO_MONITOR) else new_sites)
+
+def handle_check_result(result, max_retries=None):
+    """Send recovery/warning/down alerts for a check result based on recent history"""
+    pending = evaluate_check_result(result, max_retries=max_retries)
+    if pending:
+        alerts.notify(pending.message, pending.email_subject, pending.email_body)
+
+def format_correlated_alert(key, results):
+    """Telegram message and email (subject, body) for failures sharing one cause"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    listed = results[:MAX_SITES_LISTED]
+    more = f"\n   … and {len(results) - len(listed)} more" if len(results) > len(listed) else ""
+    
+    site_lines = "\n".join(f"   • {result['url']} ({classify_error(result)})" for result in listed)
+    message = f"""🚨 <b>CORRELATED OUTAGE: {len(results)} sites failing</b>
+
+🔗 <b>Shared cause:</b> {describe_key(key)}
+🕐 <b>Time:</b> {now}
+
+🌐 <b>Sites:</b>
+{site_lines}{more}
+
+━━━━━━━━━━━━━━━━━━━━
+Individual alerts for these sites were suppressed."""
+    
+    site_rows = "".join(f"<li>{result['url']} ({classify_error(result)})</li>" for result in listed)
+    email_subject = f"🚨 CORRELATED OUTAGE: {len(results)} sites failing ({describe_key(key)})"
+    email_body = f"""
+            <html>
+            <body style="font-family: Arial, sans-serif; padding: 20px;">
+                <div style="background: #dc2626; color: white; padding: 20px; border-radius: 10px;">
+                    <h2>🚨 {len(results)} sites failing together</h2>
+                    <p><strong>Shared cause:</strong> {describe_key(key)}</p>
+                </div>
+                <div style="margin-top: 20px; padding: 15px; background: #f9fafb; border-radius: 8px;">
+                    <ul>{site_rows}</ul>
+                    {f"<p>… and {len(results) - len(listed)} more</p>" if more else ""}
+                    <p><strong>Time:</strong> {now}</p>
+                </div>
+            </body>
+            </html>
+            """
+    return message, email_subject, email_body
+
+def format_recovery_digest(results):
+    """Telegram message and email (subject, body) for many sites recovering in one sweep"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    listed = results[:MAX_SITES_LISTED]
+    more = f"\n   … and {len(results) - len(listed)} more" if len(results) > len(listed) else ""
+    
+    site_lines = "\n".join(f"   • {result['url']} ({result['response_time']:.2f}s)" for result in listed)
+    message = f"""✅ <b>RECOVERY: {len(results)} sites back online</b>
+
+🕐 <b>Time:</b> {now}
+
+🌐 <b>Sites:</b>
+{site_lines}{more}"""
+    
+    site_rows = "".join(f"<li>{result['url']} ({result['response_time']:.2f}s)</li>" for result in listed)
+    email_subject = f"✅ RECOVERY: {len(results)} sites are back online"
+    email_body = f"""
+            <html>
+            <body style="font-family: Arial, sans-serif; padding: 20px;">
+                <div style="background: #10b981; color: white; padding: 20px; border-radius: 10px;">
+                    <h2>✅ {len(results)} sites recovered</h2>
+                </div>
+                <div style="margin-top: 20px; padding: 15px; background: #f9fafb; border-radius: 8px;">
+                    <ul>{site_rows}</ul>
+                    {f"<p>… and {len(results) - len(listed)} more</p>" if more else ""}
+                    <p><strong>Time:</strong> {now}</p>
+                </div>
+            </body>
+            </html>
+            """
+    return message, email_subject, email_body
+
+def dispatch_sweep_alerts(pending_alerts):
+    """Send a sweep's alerts, folding failures that share a cause into one incident each
+    
+    With the adaptive scheduler a failing site can be checked several times
+    in one correlation window; only its latest failure counts, so a group
+    is always that many distinct sites.
+    """
+    latest = {}
+    for pending in pending_alerts:
+        if pending.kind != 'recovery':
+            latest.pop(pending.result['url'], None)
+            latest[pending.result['url']] = pending
+    failures = list(latest.values())
+    recoveries = [pending for pending in pending_alerts if pending.kind == 'recovery']
+    
+    groups, ungrouped = group_failures([pending.result for pending in failures])
+    for key, results in groups:
+        print(f"🔗 {len(results)} failures grouped ({describe_key(key)})")
+        alerts.notify(*format_correlated_alert(key, results))
+    
+    by_result = {id(pending.result): pending for pending in failures}
+    for result in ungrouped:
+        pending = by_result[id(result)]
+        alerts.notify(pending.message, pending.email_subject, pending.email_body)
+    
+    if len(recoveries) >= ALERT_STORM_THRESHOLD:
+        alerts.notify(*format_recovery_digest([pending.result for pending in recoveries]))
     else:
-        print(f"   ⏸️  Not alerting yet - this is the first failure (need 2+ consecutive)")
+        for pending in recoveries:
+            alerts.notify(pending.message, pending.email_subject, pending.email_body)
+
+def check_website(url, max_retries=None, retry_delay=2):
+    """Check if a website is responding with retry logic"""
+    warm_site_state([url])
+    result = probe_website(url, max_retries=max_retries, retry_delay=retry_delay)
+    handle_check_result(result, max_retries=max_retries)
+    return result
+
+def get_host_semaphore(url):
+    """Get the semaphore limiting parallel checks against the host of a URL"""
+    host = urlparse(url).hostname or url
     
-    return {
-        "url": url,
-        "status": "down",
-        "response_time": None,
-        "error": str(last_error),
-        "timestamp": datetime.now()
-    }
+    with _host_semaphores_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(PER_HOST_CONCURRENCY)
+            _host_semaphores[host] = semaphore
+    
+    return semaphore
+
+def check_and_save(url):
+    """Probe one site (respecting the per-host limit) and save the result
+    
+    Alerting waits for the rest of the sweep; see dispatch_sweep_alerts.
+    """
+    with get_host_semaphore(url):
+        result = probe_website(url)
+    
+    # Queue for the database; written in batches
+    write_buffer.add(result)
+    
+    return result
 
 def check_all_sites():
-    """Check all monitored sites"""
+    """Check all monitored sites concurrently"""
     print(f"\n{'='*50}")
     print(f"🔍 Checking sites at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'='*50}")
     
-    results = []
-    for site in SITES_TO_MONITOR:
-        result = check_website(site)
-        results.append(result)
-        
-        # Save to database
-        save_check(result)
-        
-        time.sleep(1)  # Wait 1 second between checks to be polite
+    if not SITES_TO_MONITOR:
+        return []
+    
+    warm_site_state(SITES_TO_MONITOR)
+    
+    started = time.monotonic()
+    workers = min(MAX_CONCURRENT_CHECKS, len(SITES_TO_MONITOR))
+    
+    # Results come back in the same order as SITES_TO_MONITOR
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="checker") as executor:
+        results = list(executor.map(check_and_save, SITES_TO_MONITOR))
+    
+    # One transaction for the rest of the sweep (a failed write doesn't change the results)
+    write_buffer.try_flush()
+    
+    # Alert on the whole sweep at once so shared failures become one incident
+    pending_alerts = [evaluate_check_result(result) for result in results]
+    dispatch_sweep_alerts([pending for pending in pending_alerts if pending])
+    
+    print(f"\n⏱  Checked {len(results)} sites in {time.monotonic() - started:.1f}s ({workers} workers)")
     
     return results
 
-def run_monitor():
-    """Main monitoring loop"""
+def refresh_sites(scheduler, watcher):
+    """Apply site list changes to the database, alert state and scheduler
+    
+    Only sites added, removed or reconfigured since the watcher's last poll
+    are touched; when sites.json hasn't changed this costs one stat().
+    """
     global SITES_TO_MONITOR
     
+    added, removed, changed = watcher.poll()
+    if not added and not removed and not changed:
+        return
+    
+    SITES_TO_MONITOR = load_sites()
+    sync_sites(SITES_TO_MONITOR)
+    
+    # Load history for sites the alert state hasn't seen yet
+    warm_site_state(added)
+    
+    for url in removed:
+        scheduler.remove(url)
+    for url in added + changed:
+        scheduler.add(url, interval=get_site_config(url).interval)
+    
+    print(f"📋 Sites updated: {len(added)} added, {len(removed)} removed, {len(changed)} reconfigured ({len(scheduler)} monitored)")
+
+def run_monitor(watcher=None):
+    """Main monitoring loop: check each site when the scheduler says it is due
+    
+    watcher decides which sites this process checks; by default it is every
+    site in sites.json (see sharding.ShardWatcher for a share of them).
+    """
     # Initialize database first
     init_database()
     
+    scheduler = SiteScheduler(CHECK_INTERVAL)
+    watcher = watcher or registry.watch()
+    
     print("🚀 Site Monitor Started!")
     print(f"Monitoring {len(SITES_TO_MONITOR)} sites")
-    print(f"Check interval: {CHECK_INTERVAL} seconds ({CHECK_INTERVAL/60} minutes)")
+    print(f"Check interval: {CHECK_INTERVAL} seconds ({CHECK_INTERVAL/60} minutes), {CHECK_MIN_INTERVAL:.0f}s while failing")
+    print(f"Concurrency: {MAX_CONCURRENT_CHECKS} checks, {PER_HOST_CONCURRENCY} per host")
     print("\nPress Ctrl+C to stop\n")
     
+    executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CHECKS, thread_name_prefix="checker")
+    in_flight = {}
+    pending_alerts = []
+    next_reload = time.monotonic()
+    next_dispatch = time.monotonic() + ALERT_CORRELATION_WINDOW
+    
     try:
         while True:
-            # Reload sites in case they changed
-            SITES_TO_MONITOR = load_sites()
+            now = time.monotonic()
+            if now >= next_reload:
+                # Pick up sites added or removed since the last look
+                refresh_sites(scheduler, watcher)
+                next_reload = now + SITES_RELOAD_INTERVAL
+            
+            for url in scheduler.pop_due(now):
+                in_flight[executor.submit(check_and_save, url)] = url
+            
+            # Wait until the next check is due or a running one finishes
+            wakeups = [next_reload - now, next_dispatch - now, scheduler.seconds_until_next(now)]
+            timeout = max(min(wakeup for wakeup in wakeups if wakeup is not None), 0)
+            if in_flight:
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(timeout)
+                done = ()
             
-            check_all_sites()
-            print(f"\n💤 Sleeping for {CHECK_INTERVAL} seconds...")
-            time.sleep(CHECK_INTERVAL)
+            for future in done:
+                url = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ Checking {url} failed unexpectedly: {e}")
+                    scheduler.record(url, 'down')
+                    continue
+                
+                scheduler.record(url, result['status'])
+                pending = evaluate_check_result(result)
+                if pending:
+                    pending_alerts.append(pending)
+            
+            write_buffer.flush_if_due()
+            
+            # Alert on everything that finished in the window at once so
+            # shared failures become one incident
+            if time.monotonic() >= next_dispatch:
+                if pending_alerts:
+                    dispatch_sweep_alerts(pending_alerts)
+                    pending_alerts = []
+                next_dispatch = time.monotonic() + ALERT_CORRELATION_WINDOW
             
     except KeyboardInterrupt:
         print("\n\n👋 Monitor stopped by user")
+        # Let checks already running finish so their results reach the buffer
+        executor.shutdown(wait=True, cancel_futures=True)
+        # Send alerts still waiting for correlation or in the digest window
+        dispatch_sweep_alerts(pending_alerts)
+        alerts.close()
+        close_session()
+        
+        # Don't lose results still waiting in the buffer
+        saved = write_buffer.flush()
+        if saved:
+            print(f"💾 Saved {saved} buffered results")
         
         # Show stats before exiting
         print("\n📊 Final Statistics:")
-        for site in SITES_TO_MONITOR:
-            stats = get_stats(site)
+        monitored = [site for site in SITES_TO_MONITOR if site in scheduler]
+        all_stats = get_all_stats(monitored)
+        for site in monitored:
+            stats = all_stats[site]
             print(f"\n{site}")
             print(f"  Total checks: {stats['total_checks']}")
             print(f"  Uptime: {stats['uptime_percentage']:.2f}%")
             print(f"  Avg response: {stats['avg_response_time']:.3f}s")
+        
+        close_connections()
 
 # Run it
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import ipaddress
+import os
+from collections import defaultdict
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ===== CORRELATION CONFIG =====
+ALERT_STORM_THRESHOLD = int(os.getenv('ALERT_STORM_THRESHOLD', 3))  # Failures sharing a cause that become one incident
+ALERT_ERROR_STORM_THRESHOLD = int(os.getenv('ALERT_ERROR_STORM_THRESHOLD', 10))  # Failures with only the error class in common that become one incident
+MAX_SITES_LISTED = 25  # Sites named in a grouped alert before "and N more"
+
+# Substrings of requests/aiohttp error messages -> error class, checked in order
+ERROR_CLASSES = [
+    (('NameResolutionError', 'Failed to resolve', 'Name or service not known', 'getaddrinfo', 'nodename nor servname'), 'DNS resolution failure'),
+    (('SSLError', 'SSL', 'certificate'), 'TLS error'),
+    (('timed out', 'Timeout', 'TimeoutError'), 'Timeout'),
+    (('Connection refused',), 'Connection refused'),
+    (('Connection reset', 'RemoteDisconnected', 'Connection aborted', 'ServerDisconnected'), 'Connection reset'),
+]
+
+def classify_error(result):
+    """Coarse failure class of a check result, e.g. "Timeout" or "HTTP 503" """
+    if result['status'] == 'warning':
+        return 'Content check failed' if result.get('error') else f"HTTP {result.get('status_code')}"
+    
+    error = result.get('error') or ''
+    for needles, error_class in ERROR_CLASSES:
+        if any(needle in error for needle in needles):
+            return error_class
+    return 'Connection error'
+
+def site_domain(url):
+    """Registrable domain of a URL's host (example.co.uk for www.example.co.uk)
+    
+    An IP address is its own domain; a single-label host (localhost) has
+    none, so None is returned.
+    """
+    host = (urlparse(url).hostname or url).lower()
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    
+    labels = host.split('.')
+    if len(labels) < 2:
+        return None
+    # Two-letter country TLDs usually register under a short second level (co.uk, com.au)
+    if len(labels) >= 3 and len(labels[-1]) == 2 and len(labels[-2]) <= 3:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+def ip_block(ip):
+    """Network a server address belongs to: its /24 (IPv4) or /48 (IPv6)"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+def correlation_keys(result):
+    """Causes a failed result could share with others, as (kind, value) pairs"""
+    keys = [('error', classify_error(result))]
+    domain = site_domain(result['url'])
+    if domain:
+        keys.append(('domain', domain))
+    block = ip_block(result['remote_ip']) if result.get('remote_ip') else None
+    if block:
+        keys.append(('network', block))
+    return keys
+
+def describe_key(key):
+    """Human-readable shared cause for a correlation key"""
+    kind, value = key
+    if kind == 'error':
+        return f"same error: {value}"
+    if kind == 'network':
+        return f"same network: {value}"
+    return f"same domain: {value}"
+
+def group_failures(results, threshold=ALERT_STORM_THRESHOLD, error_threshold=ALERT_ERROR_STORM_THRESHOLD):
+    """Split one sweep's failed results into correlated groups and loners
+    
+    Repeatedly takes the cause shared by the most remaining failures while
+    that is at least threshold of them. Unrelated sites time out or refuse
+    connections all the time, so a group sharing nothing but the error
+    class needs error_threshold failures. Returns ([(key, results), ...],
+    ungrouped results), both in sweep order.
+    """
+    candidates = defaultdict(list)
+    for index, result in enumerate(results):
+        for key in correlation_keys(result):
+            candidates[key].append(index)
+    
+    groups = []
+    assigned = set()
+    while True:
+        best_key, best, best_rank = None, [], (0, False)
+        for key, members in candidates.items():
+            remaining = [i for i in members if i not in assigned]
+            if len(remaining) < (error_threshold if key[0] == 'error' else threshold):
+                continue
+            # On ties an infrastructure cause (network, domain) beats an error class
+            rank = (len(remaining), key[0] != 'error')
+            if rank > best_rank:
+                best_key, best, best_rank = key, remaining, rank
+        if best_key is None:
+            break
+        groups.append((best_key, [results[i] for i in best]))
+        assigned.update(best)
+        del candidates[best_key]
+    
+    ungrouped = [result for index, result in enumerate(results) if index not in assigned]
+    return groups, ungrouped
@@ -1,203 +1,1045 @@
 import sqlite3
-from datetime import datetime
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
 
-DB_FILE = "monitor.db"
+# Load environment variables
+load_dotenv()
 
-def init_database():
-    """Create the database and tables if they don't exist"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+# ===== DATABASE CONFIG =====
+DB_FILE = os.getenv('DB_FILE', 'monitor.db')  # Shared by the checker, dashboard and reports
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))  # Idle connections kept open for reuse
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 65536))  # Page cache per connection
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 268435456))  # Bytes of the file memory-mapped for reads
+DB_BUSY_TIMEOUT = 30  # Seconds to wait on a locked database before failing
+
+# Idle connections, tagged with the (DB_FILE, pid) they were opened for
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+_pool_key = None
+
+def open_connection():
+    """Open a new connection to DB_FILE with WAL journaling and tuned pragmas"""
+    conn = sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+    # WAL lets the dashboard read while the checker writes, without "database is locked"
+    conn.execute('PRAGMA journal_mode = WAL')
+    # Safe with WAL: a power loss can only drop the last commits, never corrupt
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+@contextmanager
+def get_connection():
+    """Borrow a pooled connection for the duration of a with block
+    
+    A connection is only used by one thread at a time; any transaction left
+    open (e.g. after an exception) is rolled back before it goes back.
+    """
+    global _pool, _pool_key
+    
+    # Start a fresh pool if DB_FILE changed or we're in a forked child
+    key = (DB_FILE, os.getpid())
+    if _pool_key != key:
+        _pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+        _pool_key = key
+    pool = _pool
+    
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = open_connection()
+    
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def close_connections():
+    """Close every idle pooled connection (e.g. on shutdown)"""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+# Per-phase latency columns (schema version 1)
+PHASE_COLUMNS = [
+    ('dns_time', 'REAL'),
+    ('connect_time', 'REAL'),
+    ('tls_time', 'REAL'),
+    ('ttfb', 'REAL'),
+    ('download_time', 'REAL'),
+    ('reused_connection', 'INTEGER'),
+]
+
+# Upper bounds (ms) of the latency histogram kept in every rollup row as a
+# percentile sketch; one extra open-ended bin catches anything slower
+LATENCY_BUCKETS_MS = [25, 50, 100, 150, 200, 300, 400, 500, 750, 1000, 1500, 2000, 3000, 5000]
+
+# Rollup granularity -> (table, strftime format of the bucket start)
+ROLLUP_TABLES = {
+    'hour': ('rollups_hourly', '%Y-%m-%d %H:00:00'),
+    'day': ('rollups_daily', '%Y-%m-%d'),
+}
+
+def migrate_add_phase_columns(cursor):
+    """Add per-phase latency columns to checks"""
+    cursor.execute('PRAGMA table_info(checks)')
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for name, column_type in PHASE_COLUMNS:
+        if name not in existing_columns:
+            cursor.execute(f'ALTER TABLE checks ADD COLUMN {name} {column_type}')
+
+def migrate_add_check_indexes(cursor):
+    """Index checks for per-site and time-range lookups"""
+    # Per-site queries filter on url and sort/range on timestamp
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_checks_url_timestamp ON checks (url, timestamp)')
+    # Fleet-wide queries (incidents) range on timestamp alone
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_checks_timestamp ON checks (timestamp)')
+
+def migrate_normalize_sites(cursor):
+    """Move URLs into a sites table and reference them from checks by integer site_id"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at DATETIME NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO sites (url, created_at)
+        SELECT url, MIN(timestamp) FROM checks GROUP BY url ORDER BY MIN(timestamp)
+    ''')
     
-    # Create checks table
+    # SQLite can't drop an indexed column, so rebuild checks without url
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS checks (
+        CREATE TABLE checks_new (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT NOT NULL,
+            site_id INTEGER NOT NULL REFERENCES sites (id),
             status TEXT NOT NULL,
             response_time REAL,
             status_code INTEGER,
             error TEXT,
-            timestamp DATETIME NOT NULL
+            timestamp DATETIME NOT NULL,
+            dns_time REAL,
+            connect_time REAL,
+            tls_time REAL,
+            ttfb REAL,
+            download_time REAL,
+            reused_connection INTEGER
         )
     ''')
+    cursor.execute('''
+        INSERT INTO checks_new (id, site_id, status, response_time, status_code, error, timestamp,
+                                dns_time, connect_time, tls_time, ttfb, download_time, reused_connection)
+        SELECT c.id, s.id, c.status, c.response_time, c.status_code, c.error, c.timestamp,
+               c.dns_time, c.connect_time, c.tls_time, c.ttfb, c.download_time, c.reused_connection
+        FROM checks c
+        JOIN sites s ON s.url = c.url
+    ''')
+    cursor.execute('DROP TABLE checks')
+    cursor.execute('ALTER TABLE checks_new RENAME TO checks')
     
-    conn.commit()
-    conn.close()
-    print("✅ Database initialized")
+    cursor.execute('CREATE INDEX idx_checks_site_timestamp ON checks (site_id, timestamp)')
+    cursor.execute('CREATE INDEX idx_checks_timestamp ON checks (timestamp)')
 
-def save_check(check_result):
-    """Save a check result to the database"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+def migrate_add_rollups(cursor):
+    """Create hourly/daily rollup tables and backfill them from existing checks"""
+    latency_bin = ' '.join(f'WHEN response_time * 1000 <= {bound} THEN {i}' for i, bound in enumerate(LATENCY_BUCKETS_MS))
     
+    for table, bucket_format in ROLLUP_TABLES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                site_id INTEGER NOT NULL REFERENCES sites (id),
+                bucket DATETIME NOT NULL,
+                total INTEGER NOT NULL,
+                up_count INTEGER NOT NULL,
+                rt_count INTEGER NOT NULL,
+                rt_sum REAL NOT NULL,
+                rt_min REAL,
+                rt_max REAL,
+                rt_histogram TEXT NOT NULL,
+                PRIMARY KEY (site_id, bucket)
+            )
+        ''')
+        
+        # Latency histograms per bucket, computed in SQL
+        cursor.execute(f'''
+            SELECT site_id, strftime('{bucket_format}', timestamp) AS bucket,
+                   CASE {latency_bin} ELSE {len(LATENCY_BUCKETS_MS)} END AS bin,
+                   COUNT(*)
+            FROM checks
+            WHERE status = 'up' AND response_time IS NOT NULL
+            GROUP BY site_id, bucket, bin
+        ''')
+        histograms = {}
+        for site_id, bucket, latency_bin_index, count in cursor.fetchall():
+            histogram = histograms.setdefault((site_id, bucket), [0] * (len(LATENCY_BUCKETS_MS) + 1))
+            histogram[latency_bin_index] = count
+        
+        cursor.execute(f'''
+            SELECT site_id, strftime('{bucket_format}', timestamp) AS bucket,
+                   COUNT(*),
+                   SUM(status = 'up'),
+                   SUM(status = 'up' AND response_time IS NOT NULL),
+                   COALESCE(SUM(CASE WHEN status = 'up' THEN response_time END), 0),
+                   MIN(CASE WHEN status = 'up' THEN response_time END),
+                   MAX(CASE WHEN status = 'up' THEN response_time END)
+            FROM checks
+            GROUP BY site_id, bucket
+        ''')
+        rows = [
+            row + (format_histogram(histograms.get((row[0], row[1]), [0] * (len(LATENCY_BUCKETS_MS) + 1))),)
+            for row in cursor.fetchall()
+        ]
+        cursor.executemany(f'''
+            INSERT OR REPLACE INTO {table} (site_id, bucket, total, up_count, rt_count, rt_sum, rt_min, rt_max, rt_histogram)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+def migrate_add_workers(cursor):
+    """Create the workers table that sharded checkers heartbeat into"""
     cursor.execute('''
-        INSERT INTO checks (url, status, response_time, status_code, error, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        check_result['url'],
-        check_result['status'],
-        check_result.get('response_time'),
-        check_result.get('status_code'),
-        check_result.get('error'),
-        check_result['timestamp']
-    ))
-    
-    conn.commit()
-    conn.close()
-
-def get_recent_checks(url, limit=10):
-    """Get recent checks for a specific URL"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            host TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            started_at DATETIME NOT NULL,
+            heartbeat_at REAL NOT NULL
+        )
+    ''')
+
+def migrate_add_incidents(cursor):
+    """Create the incidents table of status changes and backfill it from existing checks"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS incidents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site_id INTEGER NOT NULL REFERENCES sites (id),
+            from_status TEXT,
+            status TEXT NOT NULL,
+            started_at DATETIME NOT NULL,
+            ended_at DATETIME,
+            duration REAL,
+            status_code INTEGER,
+            error TEXT
+        )
+    ''')
     
+    # A row per state a site entered, from the check where its status differs
+    # from the one before; it ends where the site's next row starts
     cursor.execute('''
-        SELECT url, status, response_time, status_code, timestamp
-        FROM checks
-        WHERE url = ?
-        ORDER BY timestamp DESC
-        LIMIT ?
-    ''', (url, limit))
-    
-    results = cursor.fetchall()
-    conn.close()
-    return results
+        INSERT INTO incidents (site_id, from_status, status, started_at, ended_at, duration, status_code, error)
+        SELECT site_id, previous_status, status, timestamp,
+               LEAD(timestamp) OVER site_changes,
+               (julianday(LEAD(timestamp) OVER site_changes) - julianday(timestamp)) * 86400,
+               status_code, error
+        FROM (
+            SELECT site_id, status, status_code, error, timestamp,
+                   LAG(status) OVER (PARTITION BY site_id ORDER BY timestamp, id) AS previous_status
+            FROM checks
+        )
+        WHERE previous_status IS NULL OR previous_status != status
+        WINDOW site_changes AS (PARTITION BY site_id ORDER BY timestamp)
+        ORDER BY timestamp
+    ''')
+    
+    # The timeline reads a time range; saving checks looks up each site's current state
+    cursor.execute('CREATE INDEX idx_incidents_started_at ON incidents (started_at)')
+    cursor.execute('CREATE INDEX idx_incidents_open ON incidents (site_id) WHERE ended_at IS NULL')
 
-def get_stats(url):
-    """Get uptime statistics for a URL"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+def migrate_add_incident_site_index(cursor):
+    """Index incidents for one site's timeline"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_incidents_site_started_at ON incidents (site_id, started_at)')
+
+# Schema migrations as (version, description, function), applied in order.
+# The database's PRAGMA user_version records the last version applied.
+MIGRATIONS = [
+    (1, "per-phase latency columns", migrate_add_phase_columns),
+    (2, "indexes on checks (url, timestamp) and (timestamp)", migrate_add_check_indexes),
+    (3, "sites table with checks.site_id instead of checks.url", migrate_normalize_sites),
+    (4, "hourly and daily rollup tables", migrate_add_rollups),
+    (5, "workers table for sharded checkers", migrate_add_workers),
+    (6, "incidents table of status changes", migrate_add_incidents),
+    (7, "index on incidents (site_id, started_at)", migrate_add_incident_site_index),
+]
+
+# url -> sites.id, filled as sites are looked up
+_site_ids = {}
+
+def get_schema_version(conn):
+    """Get the schema version of an open database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def run_migrations(conn, target_version=None):
+    """Apply pending schema migrations (up to target_version), each in its own transaction"""
+    current_version = get_schema_version(conn)
+    
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+        if target_version is not None and version > target_version:
+            break
+        
+        cursor = conn.cursor()
+        try:
+            # Take the write lock first, then re-check: another process may
+            # have applied this migration since the version was read
+            cursor.execute('BEGIN IMMEDIATE')
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migrate(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        print(f"🔧 Applied schema migration {version}: {description}")
+
+def init_database():
+    """Create the database and tables if they don't exist, then upgrade the schema"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Create checks table (schema version 0, brought up to date by the migrations)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS checks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                response_time REAL,
+                status_code INTEGER,
+                error TEXT,
+                timestamp DATETIME NOT NULL
+            )
+        ''')
+        conn.commit()
+        
+        run_migrations(conn)
+    
+    print("✅ Database initialized")
+
+def lookup_site_id(cursor, url, create=False):
+    """Get the sites.id for a URL (None if unknown), optionally registering it"""
+    site_id = _site_ids.get(url)
+    if site_id is not None:
+        return site_id
+    
+    if create:
+        cursor.execute('INSERT OR IGNORE INTO sites (url, created_at) VALUES (?, ?)', (url, datetime.now()))
+    
+    cursor.execute('SELECT id FROM sites WHERE url = ?', (url,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    
+    _site_ids[url] = row[0]
+    return row[0]
+
+def get_site_id(url):
+    """Get the sites.id for a URL (None if it has never been monitored)"""
+    if url in _site_ids:
+        return _site_ids[url]
+    
+    with get_connection() as conn:
+        site_id = lookup_site_id(conn.cursor(), url)
+    return site_id
+
+def get_site_ids(urls):
+    """Get {url: sites.id} for many URLs in one query (URLs never monitored are left out)"""
+    missing = [url for url in urls if url not in _site_ids]
+    if missing:
+        with get_connection() as conn:
+            placeholders = ','.join(['?' for _ in missing])
+            for url, site_id in conn.execute(f'SELECT url, id FROM sites WHERE url IN ({placeholders})', missing):
+                _site_ids[url] = site_id
     
-    # Total checks
-    cursor.execute('SELECT COUNT(*) FROM checks WHERE url = ?', (url,))
-    total = cursor.fetchone()[0]
+    return {url: _site_ids[url] for url in urls if url in _site_ids}
+
+def get_site_url(site_id):
+    """Get the URL of a sites.id (None if there is no such site)"""
+    with get_connection() as conn:
+        row = conn.execute('SELECT url FROM sites WHERE id = ?', (site_id,)).fetchone()
+    return row[0] if row else None
+
+def sync_sites(urls):
+    """Register any new URLs and mark exactly these as actively monitored"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        now = datetime.now()
+        cursor.executemany('INSERT OR IGNORE INTO sites (url, created_at) VALUES (?, ?)', [(url, now) for url in urls])
+        
+        placeholders = ','.join(['?' for _ in urls])
+        cursor.execute(f'UPDATE sites SET active = (url IN ({placeholders})) WHERE active != (url IN ({placeholders}))',
+                       list(urls) * 2)
+        
+        conn.commit()
+
+def set_site_active(url, active):
+    """Start or stop monitoring a site, keeping its history either way"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        site_id = lookup_site_id(cursor, url, create=active)
+        if site_id is not None:
+            cursor.execute('UPDATE sites SET active = ? WHERE id = ?', (int(active), site_id))
+        
+        conn.commit()
+
+def rename_site(old_url, new_url):
+    """Change a site's URL, keeping its check history. Returns False if new_url is already a site"""
+    with get_connection() as conn:
+        try:
+            conn.execute('UPDATE sites SET url = ? WHERE url = ?', (new_url, old_url))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            return False
     
-    # Successful checks
-    cursor.execute('SELECT COUNT(*) FROM checks WHERE url = ? AND status = "up"', (url,))
-    successful = cursor.fetchone()[0]
+    _site_ids.pop(old_url, None)
+    _site_ids.pop(new_url, None)
+    return True
+
+def heartbeat_worker(worker_id, host, pid):
+    """Record that a checker shard is alive (registering it on the first call)"""
+    with get_connection() as conn:
+        conn.execute('''
+            INSERT INTO workers (worker_id, host, pid, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (worker_id) DO UPDATE SET host = excluded.host, pid = excluded.pid, heartbeat_at = excluded.heartbeat_at
+        ''', (worker_id, host, pid, datetime.now(), time.time()))
+        conn.commit()
+
+def get_live_workers(timeout):
+    """IDs of the checker shards that heartbeated within the last timeout seconds, sorted"""
+    with get_connection() as conn:
+        cursor = conn.execute('SELECT worker_id FROM workers WHERE heartbeat_at >= ? ORDER BY worker_id',
+                              (time.time() - timeout,))
+        return [row[0] for row in cursor.fetchall()]
+
+def remove_worker(worker_id):
+    """Deregister a checker shard so the others take over its sites right away"""
+    with get_connection() as conn:
+        conn.execute('DELETE FROM workers WHERE worker_id = ?', (worker_id,))
+        conn.commit()
+
+def format_histogram(histogram):
+    """Encode latency histogram counts for storage"""
+    return ','.join(str(count) for count in histogram)
+
+def parse_histogram(text):
+    """Decode stored latency histogram counts"""
+    return [int(count) for count in text.split(',')]
+
+def percentile_bin(histogram, percentile):
+    """Index of the latency histogram bin holding a percentile (None if the histogram is empty)"""
+    total = sum(histogram)
+    if total == 0:
+        return None
     
-    # Average response time
-    cursor.execute('SELECT AVG(response_time) FROM checks WHERE url = ? AND status = "up"', (url,))
-    avg_response = cursor.fetchone()[0]
+    rank = total * percentile / 100
+    cumulative = 0
+    for i, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= rank:
+            break
+    return i
+
+def estimate_percentile(histogram, percentile):
+    """Estimate a response-time percentile (seconds) from a latency histogram
     
-    conn.close()
+    Returns the upper bound of the bin holding the percentile, so the estimate
+    errs on the slow side; None if the histogram is empty. The last bin has
+    no upper bound, so a percentile slower than LATENCY_BUCKETS_MS[-1] is
+    capped there: the true value is at least that (see percentile_capped).
+    """
+    i = percentile_bin(histogram, percentile)
+    if i is None:
+        return None
+    return LATENCY_BUCKETS_MS[min(i, len(LATENCY_BUCKETS_MS) - 1)] / 1000
+
+def percentile_capped(histogram, percentile):
+    """Whether estimate_percentile() is only a lower bound (the percentile is past the last bucket)"""
+    return percentile_bin(histogram, percentile) == len(LATENCY_BUCKETS_MS)
+
+def update_rollups(cursor, checks):
+    """Fold checks, given as (site_id, timestamp, status, response_time), into the rollup tables
     
-    if total > 0:
-        uptime_percentage = (successful / total) * 100
-    else:
-        uptime_percentage = 0
+    Must run in the same transaction as the checks insert, which holds the
+    write lock so concurrent writers can't interleave the read-modify-write.
+    """
+    for table, bucket_format in ROLLUP_TABLES.values():
+        # Aggregate in memory first so each bucket is written once
+        buckets = {}
+        for site_id, timestamp, status, response_time in checks:
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp)
+            
+            key = (site_id, timestamp.strftime(bucket_format))
+            rollup = buckets.get(key)
+            if rollup is None:
+                # [total, up_count, rt_count, rt_sum, rt_min, rt_max, histogram]
+                rollup = buckets[key] = [0, 0, 0, 0.0, None, None, [0] * (len(LATENCY_BUCKETS_MS) + 1)]
+            
+            rollup[0] += 1
+            if status == 'up':
+                rollup[1] += 1
+                if response_time is not None:
+                    rollup[2] += 1
+                    rollup[3] += response_time
+                    rollup[4] = response_time if rollup[4] is None else min(rollup[4], response_time)
+                    rollup[5] = response_time if rollup[5] is None else max(rollup[5], response_time)
+                    rollup[6][bisect_left(LATENCY_BUCKETS_MS, response_time * 1000)] += 1
+        
+        for (site_id, bucket), (total, up_count, rt_count, rt_sum, rt_min, rt_max, histogram) in buckets.items():
+            cursor.execute(f'''
+                SELECT total, up_count, rt_count, rt_sum, rt_min, rt_max, rt_histogram
+                FROM {table}
+                WHERE site_id = ? AND bucket = ?
+            ''', (site_id, bucket))
+            existing = cursor.fetchone()
+            
+            if existing:
+                total += existing[0]
+                up_count += existing[1]
+                rt_count += existing[2]
+                rt_sum += existing[3]
+                rt_min = min(v for v in (rt_min, existing[4]) if v is not None) if rt_count else None
+                rt_max = max(v for v in (rt_max, existing[5]) if v is not None) if rt_count else None
+                histogram = [a + b for a, b in zip(histogram, parse_histogram(existing[6]))]
+            
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO {table} (site_id, bucket, total, up_count, rt_count, rt_sum, rt_min, rt_max, rt_histogram)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (site_id, bucket, total, up_count, rt_count, rt_sum, rt_min, rt_max, format_histogram(histogram)))
+
+def update_incidents(cursor, checks):
+    """Record status changes among checks, given as (site_id, timestamp, status, status_code, error)
     
+    Each site has one open incidents row (ended_at NULL) for the state it is
+    in; a check with another status closes it and opens the next. Must run in
+    the same transaction as the checks insert, like update_rollups().
+    """
+    checks_by_site = {}
+    for site_id, timestamp, status, status_code, error in checks:
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        checks_by_site.setdefault(site_id, []).append((timestamp, status, status_code, error))
+    
+    for site_id, site_checks in checks_by_site.items():
+        cursor.execute('SELECT id, status, started_at FROM incidents WHERE site_id = ? AND ended_at IS NULL', (site_id,))
+        current_id, current_status, started_at = cursor.fetchone() or (None, None, None)
+        if isinstance(started_at, str):
+            started_at = datetime.fromisoformat(started_at)
+        
+        for timestamp, status, status_code, error in sorted(site_checks, key=lambda check: check[0]):
+            # Same state, or older than the state we already know (a late write)
+            if status == current_status or (started_at is not None and timestamp < started_at):
+                continue
+            
+            if current_id is not None:
+                cursor.execute('UPDATE incidents SET ended_at = ?, duration = ? WHERE id = ?',
+                               (timestamp, (timestamp - started_at).total_seconds(), current_id))
+            cursor.execute('''
+                INSERT INTO incidents (site_id, from_status, status, started_at, status_code, error)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (site_id, current_status, status, timestamp, status_code, error))
+            current_id, current_status, started_at = cursor.lastrowid, status, timestamp
+
+def save_checks(check_results):
+    """Save many check results in a single transaction (one commit/fsync)"""
+    if not check_results:
+        return
+    
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        rows = []
+        rollup_checks = []
+        incident_checks = []
+        for check_result in check_results:
+            reused_connection = check_result.get('reused_connection')
+            site_id = lookup_site_id(cursor, check_result['url'], create=True)
+            
+            rows.append((
+                site_id,
+                check_result['status'],
+                check_result.get('response_time'),
+                check_result.get('status_code'),
+                check_result.get('error'),
+                check_result['timestamp'],
+                check_result.get('dns_time'),
+                check_result.get('connect_time'),
+                check_result.get('tls_time'),
+                check_result.get('ttfb'),
+                check_result.get('download_time'),
+                int(reused_connection) if reused_connection is not None else None
+            ))
+            rollup_checks.append((site_id, check_result['timestamp'], check_result['status'], check_result.get('response_time')))
+            incident_checks.append((site_id, check_result['timestamp'], check_result['status'],
+                                    check_result.get('status_code'), check_result.get('error')))
+        
+        cursor.executemany('''
+            INSERT INTO checks (site_id, status, response_time, status_code, error, timestamp,
+                                dns_time, connect_time, tls_time, ttfb, download_time, reused_connection)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        
+        update_rollups(cursor, rollup_checks)
+        update_incidents(cursor, incident_checks)
+        
+        conn.commit()
+
+def save_check(check_result):
+    """Save a check result to the database"""
+    save_checks([check_result])
+
+class CheckWriteBuffer:
+    """Write-behind buffer that saves check results in batches
+    
+    Results are written with save_checks once max_size are pending or the
+    oldest has waited max_age seconds (checked as results arrive, or via
+    flush_if_due), and whenever flush() is called explicitly. A failed
+    threshold write is logged and retried later rather than raised, so it
+    never reaches the code handling the check itself.
+    """
+    
+    def __init__(self, max_size=500, max_age=10.0):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._pending = []
+        self._oldest = None
+        self._retry_at = 0
+        self._lock = threading.Lock()
+        # Held across swap and save so batches are written one at a time, in order
+        self._flush_lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._pending)
+    
+    def _is_due(self):
+        if time.monotonic() < self._retry_at:
+            return False
+        return len(self._pending) >= self.max_size or (
+            self._oldest is not None and time.monotonic() - self._oldest >= self.max_age
+        )
+    
+    def add(self, check_result):
+        """Queue a result, flushing if a threshold has been reached"""
+        with self._lock:
+            self._pending.append(check_result)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = self._is_due()
+        
+        if due:
+            self.try_flush()
+    
+    def flush_if_due(self):
+        """Flush if the size or age threshold has been reached"""
+        with self._lock:
+            due = self._is_due()
+        
+        if due:
+            self.try_flush()
+    
+    def try_flush(self):
+        """flush(), but log a failed write instead of raising; the results stay buffered for the next attempt"""
+        try:
+            return self.flush()
+        except Exception as e:
+            print(f"⚠️ Couldn't save {len(self)} buffered results, will retry: {e}")
+            return 0
+    
+    def flush(self):
+        """Write every pending result now, returning how many were saved"""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+                self._oldest = None
+            
+            if not batch:
+                return 0
+            
+            try:
+                save_checks(batch)
+            except Exception:
+                # Keep the results for the next attempt rather than losing them,
+                # and give the database max_age seconds before the thresholds retry
+                with self._lock:
+                    self._pending = batch + self._pending
+                    self._oldest = time.monotonic()
+                    self._retry_at = self._oldest + self.max_age
+                raise
+            
+            return len(batch)
+
+def get_latest_check_id():
+    """id of the newest saved check (0 if none); changes whenever results are written"""
+    with get_connection() as conn:
+        # MAX of the rowid is read straight from the end of the table's B-tree
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM checks').fetchone()[0]
+
+def get_recent_checks(url, limit=10, until=None):
+    """Get recent checks for a specific URL (the last ones before until, if given)
+    
+    Rows are (url, status, response_time, status_code, timestamp, dns_time,
+    connect_time, tls_time, ttfb, download_time, reused_connection).
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        params = [lookup_site_id(cursor, url)]
+        until_filter = ''
+        if until is not None:
+            until_filter = 'AND c.timestamp < ?'
+            params.append(until)
+        cursor.execute(f'''
+            SELECT s.url, c.status, c.response_time, c.status_code, c.timestamp,
+                   c.dns_time, c.connect_time, c.tls_time, c.ttfb, c.download_time, c.reused_connection
+            FROM checks c
+            JOIN sites s ON s.id = c.site_id
+            WHERE c.site_id = ? {until_filter}
+            ORDER BY c.timestamp DESC
+            LIMIT ?
+        ''', params + [limit])
+        
+        results = cursor.fetchall()
+    return results
+
+def get_recent_statuses(urls=None, limit=8):
+    """Get the last few (status, response_time) pairs of many URLs in one query
+    
+    Returns {url: [(status, response_time), ...]} oldest first, for the URLs
+    given (or every active site when urls is None).
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        if urls is None:
+            site_filter = 's.active = 1'
+            params = [limit]
+        else:
+            urls = list(urls)
+            site_filter = f"s.url IN ({','.join(['?' for _ in urls])})"
+            params = urls + [limit]
+        
+        # Number each site's checks newest first and keep the first few
+        cursor.execute(f'''
+            SELECT url, status, response_time FROM (
+                SELECT s.url, c.status, c.response_time, c.timestamp,
+                       ROW_NUMBER() OVER (PARTITION BY c.site_id ORDER BY c.timestamp DESC) AS n
+                FROM checks c
+                JOIN sites s ON s.id = c.site_id
+                WHERE {site_filter}
+            )
+            WHERE n <= ?
+            ORDER BY url, timestamp
+        ''', params)
+        
+        results = cursor.fetchall()
+    
+    recent = {}
+    for url, status, response_time in results:
+        recent.setdefault(url, []).append((status, response_time))
+    return recent
+
+def summarize_stats(total, successful, avg_response, last_status=None, last_checked=None):
+    """Build a stats dict from raw counts"""
     return {
         'total_checks': total,
         'successful_checks': successful,
-        'uptime_percentage': uptime_percentage,
-        'avg_response_time': avg_response if avg_response else 0
+        'uptime_percentage': (successful / total) * 100 if total > 0 else 0,
+        'avg_response_time': avg_response if avg_response else 0,
+        'last_status': last_status or 'unknown',
+        'last_checked': last_checked
     }
 
-def get_checks_by_date_range(url, start_date, end_date):
-    """Get checks for a URL within a date range"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+def rollup_totals_source(until=None):
+    """(SQL table or subquery, parameters) of rollup rows covering every check before until
     
-    cursor.execute('''
-        SELECT timestamp, status, response_time, status_code, error
-        FROM checks
-        WHERE url = ? AND timestamp BETWEEN ? AND ?
-        ORDER BY timestamp DESC
-    ''', (url, start_date, end_date))
+    Whole days come from the daily rollups and the hours of until's own day
+    from the hourly ones, so until is honoured to the hour (rounded down).
+    With until=None it is just the daily rollups.
+    """
+    if until is None:
+        return 'rollups_daily', []
     
-    results = cursor.fetchall()
-    conn.close()
-    
-    return results
+    day = until.strftime(ROLLUP_TABLES['day'][1])
+    source = '''(
+        SELECT site_id, total, up_count, rt_sum, rt_count FROM rollups_daily WHERE bucket < ?
+        UNION ALL
+        SELECT site_id, total, up_count, rt_sum, rt_count FROM rollups_hourly WHERE bucket >= ? AND bucket < ?
+    )'''
+    return source, [day, f"{day} 00:00:00", until.strftime(ROLLUP_TABLES['hour'][1])]
 
-def get_all_incidents(hours=168):
-    """Get all incident events (status changes) across all sites"""
-    from datetime import datetime, timedelta
+def get_all_stats(urls=None, until=None):
+    """Get uptime statistics and last status for many URLs in one grouped query
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    Returns {url: stats} for every URL given (or every active site when urls
+    is None); URLs with no checks get zeroed stats. With until, only checks
+    before then count (see rollup_totals_source).
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        if urls is None:
+            site_filter = 's.active = 1'
+            site_params = []
+        else:
+            urls = list(urls)
+            site_filter = f"s.url IN ({','.join(['?' for _ in urls])})"
+            site_params = urls
+        
+        rollups, rollup_params = rollup_totals_source(until)
+        check_filter = 'AND timestamp < ?' if until is not None else ''
+        check_params = [until, until] if until is not None else []
+        
+        # Totals come from the daily rollups (one row per site per day), the last
+        # status from the newest check via the (site_id, timestamp) index
+        cursor.execute(f'''
+            SELECT s.url,
+                   COALESCE(SUM(r.total), 0),
+                   COALESCE(SUM(r.up_count), 0),
+                   SUM(r.rt_sum) / SUM(r.rt_count),
+                   (SELECT status FROM checks WHERE site_id = s.id {check_filter} ORDER BY timestamp DESC LIMIT 1),
+                   (SELECT MAX(timestamp) FROM checks WHERE site_id = s.id {check_filter})
+            FROM sites s
+            LEFT JOIN {rollups} r ON r.site_id = s.id
+            WHERE {site_filter}
+            GROUP BY s.id
+        ''', check_params + rollup_params + site_params)
+        
+        results = cursor.fetchall()
     
-    since = datetime.now() - timedelta(hours=hours)
+    stats = {row[0]: summarize_stats(*row[1:]) for row in results}
     
-    # Get all checks ordered by time
-    cursor.execute('''
-        SELECT url, timestamp, status, status_code, error
-        FROM checks
-        WHERE timestamp > ?
-        ORDER BY timestamp ASC
-    ''', (since,))
-    
-    all_checks = cursor.fetchall()
-    conn.close()
-    
-    if not all_checks:
-        return []
-    
-    # Identify incidents (status changes)
-    incidents = []
-    site_previous_status = {}
-    
-    for check in all_checks:
-        url, timestamp, status, status_code, error = check
-        
-        previous_status = site_previous_status.get(url)
-        
-        # Detect status change (skip first check for each site)
-        if previous_status is not None and previous_status != status:
-            incident = {
-                'url': url,
-                'timestamp': timestamp,
-                'from_status': previous_status,
-                'to_status': status,
-                'status_code': status_code,
-                'error': error
-            }
-            incidents.append(incident)
+    # Sites never checked (or not registered yet) still get an entry
+    for url in urls or []:
+        if url not in stats:
+            stats[url] = summarize_stats(0, 0, None)
+    
+    return stats
+
+def get_stats(url):
+    """Get uptime statistics for a URL"""
+    return get_all_stats([url])[url]
+
+def get_rollups(url, since, granularity='hour', until=None):
+    """Get hourly or daily aggregates for a URL since (and optionally until) a datetime, oldest first"""
+    table, bucket_format = ROLLUP_TABLES[granularity]
+    until_filter = 'AND bucket <= ?' if until is not None else ''
+    
+    with get_connection() as conn:
+        cursor = conn.cursor()
         
-        site_previous_status[url] = status
+        # Include the (partial) buckets that since and until fall in
+        params = [lookup_site_id(cursor, url), since.strftime(bucket_format)]
+        if until is not None:
+            params.append(until.strftime(bucket_format))
+        cursor.execute(f'''
+            SELECT bucket, total, up_count, rt_count, rt_sum, rt_min, rt_max, rt_histogram
+            FROM {table}
+            WHERE site_id = ? AND bucket >= ? {until_filter}
+            ORDER BY bucket ASC
+        ''', params)
+        
+        results = cursor.fetchall()
+    
+    rollups = []
+    for bucket, total, up_count, rt_count, rt_sum, rt_min, rt_max, rt_histogram in results:
+        histogram = parse_histogram(rt_histogram)
+        rollups.append({
+            'bucket': bucket,
+            'total_checks': total,
+            'successful_checks': up_count,
+            'uptime_percentage': (up_count / total) * 100 if total > 0 else 0,
+            'avg_response_time': rt_sum / rt_count if rt_count else None,
+            'min_response_time': rt_min,
+            'max_response_time': rt_max,
+            'p95_response_time': estimate_percentile(histogram, 95),
+            # p95 is at least p95_response_time rather than about it
+            'p95_capped': percentile_capped(histogram, 95)
+        })
     
-    # Return most recent first
-    return list(reversed(incidents))
+    return rollups
 
-def get_overall_stats():
-    """Get overall statistics across all sites (current sites only)"""
-    from sites_config import load_sites
+def get_rollup_versions(urls, granularity='hour'):
+    """Get {url: (newest bucket, its check count)} from the hourly or daily rollups
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    Saving a check changes its site's value (a new bucket or a higher
+    count), so it identifies the version of a site's rollup data; sites
+    without rollups are left out. One primary key lookup per site.
+    """
+    table, _ = ROLLUP_TABLES[granularity]
+    urls = list(urls)
     
-    # Get currently monitored sites
-    current_sites = load_sites()
+    with get_connection() as conn:
+        placeholders = ','.join(['?' for _ in urls])
+        rows = conn.execute(f'''
+            SELECT s.url,
+                   (SELECT bucket || '|' || total FROM {table} r WHERE r.site_id = s.id ORDER BY bucket DESC LIMIT 1)
+            FROM sites s
+            WHERE s.url IN ({placeholders})
+        ''', urls).fetchall()
     
-    if not current_sites:
-        conn.close()
-        return {
-            'total_checks': 0,
-            'successful_checks': 0,
-            'total_sites': 0,
-            'overall_uptime': 0,
-            'avg_response_time': 0
-        }
+    return {url: tuple(version.split('|')) for url, version in rows if version is not None}
+
+def get_checks_by_date_range(url, start_date, end_date):
+    """Get checks for a URL within a date range"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT timestamp, status, response_time, status_code, error
+            FROM checks
+            WHERE site_id = ? AND timestamp BETWEEN ? AND ?
+            ORDER BY timestamp DESC
+        ''', (lookup_site_id(cursor, url), start_date, end_date))
+        
+        results = cursor.fetchall()
+    
+    return results
+
+def get_all_incidents(hours=168):
+    """Get all incident events (status changes) across all sites, most recent first
+    
+    Each has the url, timestamp and from/to status of the change, the
+    status_code and error of the check that caused it, and when that state
+    ended and its duration in seconds (None while it lasts).
+    """
+    since = datetime.now() - timedelta(hours=hours)
+    
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        # A range read on started_at; a site's first known state isn't a change
+        cursor.execute('''
+            SELECT s.url, i.started_at, i.from_status, i.status, i.status_code, i.error, i.ended_at, i.duration
+            FROM incidents i
+            JOIN sites s ON s.id = i.site_id
+            WHERE i.started_at > ? AND i.from_status IS NOT NULL
+            ORDER BY i.started_at DESC, i.id DESC
+        ''', (since,))
+        
+        results = cursor.fetchall()
     
-    # Build query to only include current sites
-    placeholders = ','.join(['?' for _ in current_sites])
+    return [{
+        'url': row[0],
+        'timestamp': row[1],
+        'from_status': row[2],
+        'to_status': row[3],
+        'status_code': row[4],
+        'error': row[5],
+        'ended_at': row[6],
+        'duration': row[7]
+    } for row in results]
+
+def get_incidents_page(limit=50, cursor=None, site_id=None, status=None, since=None, until=None, min_duration=None):
+    """Get one page of status changes, most recent first, optionally filtered
     
-    # Total checks for current sites only
-    cursor.execute(f'SELECT COUNT(*) FROM checks WHERE url IN ({placeholders})', current_sites)
-    total_checks = cursor.fetchone()[0]
+    Pages are keyed on (started_at, id): pass the returned cursor to get the
+    next, older page (cursor is None after the last one). Each page is an
+    index range read of limit rows however far back it is. status filters on
+    the status changed to; min_duration (seconds) counts ongoing states up to
+    now. Incidents are dicts like get_all_incidents() returns, plus the id.
+    """
+    filters = ['i.from_status IS NOT NULL']
+    params = []
+    if cursor is not None:
+        filters.append('(i.started_at, i.id) < (?, ?)')
+        params.extend(cursor)
+    if site_id is not None:
+        filters.append('i.site_id = ?')
+        params.append(site_id)
+    if status is not None:
+        filters.append('i.status = ?')
+        params.append(status)
+    if since is not None:
+        filters.append('i.started_at >= ?')
+        params.append(since)
+    if until is not None:
+        filters.append('i.started_at < ?')
+        params.append(until)
+    if min_duration is not None:
+        filters.append("COALESCE(i.duration, (julianday('now', 'localtime') - julianday(i.started_at)) * 86400) >= ?")
+        params.append(min_duration)
     
-    # Successful checks for current sites only
-    cursor.execute(f'SELECT COUNT(*) FROM checks WHERE url IN ({placeholders}) AND status = "up"', current_sites)
-    successful_checks = cursor.fetchone()[0]
+    with get_connection() as conn:
+        # One row more than asked for tells whether there is another page
+        rows = conn.execute(f'''
+            SELECT i.id, s.url, i.started_at, i.from_status, i.status, i.status_code, i.error, i.ended_at, i.duration
+            FROM incidents i
+            JOIN sites s ON s.id = i.site_id
+            WHERE {' AND '.join(filters)}
+            ORDER BY i.started_at DESC, i.id DESC
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
     
-    # Total sites monitored (current only)
-    total_sites = len(current_sites)
+    incidents = [{
+        'id': row[0],
+        'url': row[1],
+        'timestamp': row[2],
+        'from_status': row[3],
+        'to_status': row[4],
+        'status_code': row[5],
+        'error': row[6],
+        'ended_at': row[7],
+        'duration': row[8]
+    } for row in rows[:limit]]
     
-    # Average response time for current sites only
-    cursor.execute(f'SELECT AVG(response_time) FROM checks WHERE url IN ({placeholders}) AND status = "up"', current_sites)
-    avg_response = cursor.fetchone()[0]
+    next_cursor = (incidents[-1]['timestamp'], incidents[-1]['id']) if len(rows) > limit else None
+    return incidents, next_cursor
+
+def get_overall_stats(urls=None, until=None):
+    """Get overall statistics across the given sites (default: the current sites), optionally only before until"""
+    from sites_config import load_sites
     
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Get currently monitored sites
+        current_sites = load_sites() if urls is None else list(urls)
+        
+        if not current_sites:
+            return {
+                'total_checks': 0,
+                'successful_checks': 0,
+                'total_sites': 0,
+                'overall_uptime': 0,
+                'avg_response_time': 0
+            }
+        
+        # Build query to only include current sites
+        placeholders = ','.join(['?' for _ in current_sites])
+        
+        # Totals for current sites only, in one pass over the daily rollups
+        rollups, rollup_params = rollup_totals_source(until)
+        cursor.execute(f'''
+            SELECT COALESCE(SUM(total), 0),
+                   COALESCE(SUM(up_count), 0),
+                   SUM(rt_sum) / SUM(rt_count)
+            FROM {rollups}
+            WHERE site_id IN (SELECT id FROM sites WHERE url IN ({placeholders}))
+        ''', rollup_params + current_sites)
+        total_checks, successful_checks, avg_response = cursor.fetchone()
+        
+        # Total sites monitored (current only)
+        total_sites = len(current_sites)
+        
     
     overall_uptime = (successful_checks / total_checks * 100) if total_checks > 0 else 0
     
@@ -8,40 +8,91 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # ===== EMAIL CONFIG =====
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() in ('1', 'true', 'yes')  # Off for a local test sink
+SMTP_TIMEOUT = 30  # Seconds to wait on the SMTP server
 SENDER_EMAIL = os.getenv('SENDER_EMAIL')
 SENDER_PASSWORD = os.getenv('SENDER_PASSWORD')
 RECIPIENT_EMAIL = os.getenv('RECIPIENT_EMAIL')
 
-def send_email_alert(subject, body):
-    """Send email alert"""
-    try:
-        # Create message
-        message = MIMEMultipart("alternative")
-        message["Subject"] = subject
-        message["From"] = SENDER_EMAIL
-        message["To"] = RECIPIENT_EMAIL
-        
-        # Add HTML body
-        html_part = MIMEText(body, "html")
-        message.attach(html_part)
-        
-        # Connect to Gmail and send
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+def email_configured():
+    """Whether there is somewhere to send email alerts"""
+    return bool(SENDER_EMAIL and RECIPIENT_EMAIL)
+
+def build_email_message(subject, body):
+    """Build the HTML message for an email alert"""
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = SENDER_EMAIL
+    message["To"] = RECIPIENT_EMAIL
+    
+    # Add HTML body
+    html_part = MIMEText(body, "html")
+    message.attach(html_part)
+    
+    return message
+
+class SMTPSession:
+    """Long-lived SMTP connection, opened (STARTTLS + login) on first use
+    
+    Not thread-safe: meant to be owned by one sender thread. A connection the
+    server dropped is reopened once before giving up.
+    """
+    
+    def __init__(self):
+        self._server = None
+    
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
             server.starttls()
+        if SENDER_PASSWORD:
             server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(message)
+        self._server = server
+    
+    @property
+    def connected(self):
+        return self._server is not None
+    
+    def send(self, message):
+        """Send a message, reconnecting if the server closed the session"""
+        if self._server is None:
+            self._connect()
         
+        try:
+            self._server.send_message(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.close()
+            self._connect()
+            self._server.send_message(message)
+    
+    def close(self):
+        """Log out and close the connection (if open)"""
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+def send_email_alert(subject, body):
+    """Send email alert over a one-off connection"""
+    session = SMTPSession()
+    try:
+        session.send(build_email_message(subject, body))
         print("📧 Email alert sent")
         return True
         
     except Exception as e:
         print(f"Failed to send email: {e}")
         return False
+    finally:
+        session.close()
 
-def format_email_alert(url, status_code=None, error=None, stats=None):
-    """Format a nice HTML email"""
+def format_email_alert(url, status_code=None, error=None, stats=None, content_error=None):
+    """Format a nice HTML email (content_error: the page lacked its expected content)"""
     if error:
         # Site is DOWN
         subject = f"🚨 ALERT: {url} is DOWN"
@@ -132,7 +183,16 @@ def format_email_alert(url, status_code=None, error=None, stats=None):
         """
     else:
         # Site has warning (unusual status code)
-        subject = f"⚠️ WARNING: {url} returned status {status_code}"
+        if content_error:
+            subject = f"⚠️ WARNING: {url} content check failed"
+        else:
+            subject = f"⚠️ WARNING: {url} returned status {status_code}"
+        content_info = f"""
+                <div class="info">
+                    <div class="label">Content Check:</div>
+                    <div class="value">{content_error}</div>
+                </div>
+                """ if content_error else ""
         
         body = f"""
         <html>
@@ -199,7 +259,7 @@ def format_email_alert(url, status_code=None, error=None, stats=None):
                     <div class="label">Status Code:</div>
                     <div class="value">{status_code}</div>
                 </div>
-                
+                {content_info}
                 <div class="info">
                     <div class="label">Historical Uptime:</div>
                     <div class="value">{stats.get('uptime', 0):.1f}%</div>
@@ -215,7 +275,3 @@ def format_email_alert(url, status_code=None, error=None, stats=None):
         """
     
     return subject, body
-        </html>
-        """
-    
-    return subject, body
@@ -0,0 +1,285 @@
+import ipaddress
+import os
+import socket
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.poolmanager import PoolManager
+from urllib3.exceptions import ConnectTimeoutError
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ===== CONNECTION POOL CONFIG =====
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 200))  # Hosts kept warm between cycles
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 4))  # Keep-alive connections per host
+
+def parse_host_pool_sizes(value):
+    """Parse per-host pool size overrides like "api.telegram.org=2,example.com=8" """
+    sizes = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            host, size = item.split('=', 1)
+            sizes[host.strip().lower()] = int(size)
+    return sizes
+
+HTTP_HOST_POOL_SIZES = parse_host_pool_sizes(os.getenv('HTTP_HOST_POOL_SIZES'))
+
+_session = None
+_session_lock = threading.Lock()
+_async_session = None
+_resolved_addresses = {}  # Host -> address the async resolver last returned for it
+
+# Connections opened (and time spent opening them) by the current thread
+# since reset_connection_tracking()
+_tracking = threading.local()
+
+def reset_connection_tracking():
+    """Start counting the connections this thread opens"""
+    _tracking.opened = 0
+    _tracking.dns_time = 0.0
+    _tracking.connect_time = 0.0
+    _tracking.tls_time = 0.0
+    _tracking.remote_ip = None
+
+def connections_opened():
+    """Number of new connections this thread opened since the last reset"""
+    return getattr(_tracking, 'opened', 0)
+
+def get_remote_ip():
+    """Server address this thread last connected (or tried to connect) to since the last reset
+    
+    Set as soon as DNS resolves, so failed connections have one too.
+    """
+    return getattr(_tracking, 'remote_ip', None)
+
+def get_phase_timings():
+    """DNS, TCP connect and TLS handshake seconds spent by this thread since the last reset
+    
+    All three are 0 when every request went over a warm keep-alive connection.
+    """
+    return {
+        'dns_time': getattr(_tracking, 'dns_time', 0.0),
+        'connect_time': getattr(_tracking, 'connect_time', 0.0),
+        'tls_time': getattr(_tracking, 'tls_time', 0.0)
+    }
+
+def is_ip_address(host):
+    """Whether host is an IPv4 or IPv6 address rather than a name"""
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+class PhaseTimingMixin:
+    """Times DNS, TCP connect and TLS for each fresh connection"""
+    
+    remote_ip = None
+    
+    def _new_conn(self):
+        dns_host = self._dns_host
+        started = time.perf_counter()
+        
+        try:
+            addresses = [info[4][0] for info in socket.getaddrinfo(dns_host, self.port, type=socket.SOCK_STREAM)]
+        except socket.gaierror:
+            # Let urllib3 raise its usual NameResolutionError
+            addresses = [dns_host]
+        
+        resolved = time.perf_counter()
+        sock = None
+        last_error = None
+        
+        # Connect to the resolved addresses in order, like socket.create_connection
+        try:
+            for address in dict.fromkeys(addresses):
+                self._dns_host = address
+                _tracking.remote_ip = address if is_ip_address(address) else None
+                try:
+                    sock = super()._new_conn()
+                    break
+                except ConnectTimeoutError as e:
+                    last_error = e
+        finally:
+            self._dns_host = dns_host
+        
+        if sock is None:
+            raise last_error
+        
+        self.phase_dns_time = resolved - started
+        self.phase_connect_time = time.perf_counter() - resolved
+        self.remote_ip = address
+        
+        return sock
+    
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        setup_time = time.perf_counter() - started
+        
+        dns_time = getattr(self, 'phase_dns_time', 0.0)
+        connect_time = getattr(self, 'phase_connect_time', 0.0)
+        
+        _tracking.opened = connections_opened() + 1
+        _tracking.dns_time = getattr(_tracking, 'dns_time', 0.0) + dns_time
+        _tracking.connect_time = getattr(_tracking, 'connect_time', 0.0) + connect_time
+        if self.is_tls:
+            # Whatever connect() spent beyond opening the socket was the TLS handshake
+            _tracking.tls_time = getattr(_tracking, 'tls_time', 0.0) + max(setup_time - dns_time - connect_time, 0.0)
+
+class TrackedHTTPConnection(PhaseTimingMixin, HTTPConnection):
+    """HTTP connection that records when (and how fast) a fresh socket is opened"""
+    
+    is_tls = False
+
+class TrackedHTTPSConnection(PhaseTimingMixin, HTTPSConnection):
+    """HTTPS connection that records when (and how fast) a fresh socket and TLS session are opened"""
+    
+    is_tls = True
+
+class TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TrackedHTTPConnection
+
+class TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TrackedHTTPSConnection
+
+class MonitorPoolManager(PoolManager):
+    """Pool manager using tracked connections and per-host pool sizes"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {
+            'http': TrackedHTTPConnectionPool,
+            'https': TrackedHTTPSConnectionPool,
+        }
+    
+    def _new_pool(self, scheme, host, port, request_context=None):
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+        
+        maxsize = HTTP_HOST_POOL_SIZES.get(host.lower())
+        if maxsize:
+            request_context = dict(request_context, maxsize=maxsize)
+        
+        return super()._new_pool(scheme, host, port, request_context)
+
+class MonitorHTTPAdapter(HTTPAdapter):
+    """requests adapter backed by MonitorPoolManager"""
+    
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = MonitorPoolManager(
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            **pool_kwargs
+        )
+
+def get_session():
+    """Get the shared, long-lived requests session used by the checker and notifiers"""
+    global _session
+    
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # Every probe is a cold request: no cookies kept from earlier ones or shared between sites
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = MonitorHTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    
+    return _session
+
+def close_session():
+    """Close the shared requests session and its pooled connections"""
+    global _session
+    
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+async def _on_dns_resolvehost_start(session, trace_config_ctx, params):
+    """aiohttp trace hook: remember when a DNS lookup began"""
+    trace_config_ctx.dns_started = time.perf_counter()
+
+async def _on_dns_resolvehost_end(session, trace_config_ctx, params):
+    """aiohttp trace hook: add DNS time for the request being traced"""
+    ctx = trace_config_ctx.trace_request_ctx
+    if ctx is not None:
+        ctx['dns_time'] = ctx.get('dns_time', 0.0) + time.perf_counter() - trace_config_ctx.dns_started
+
+async def _on_connection_create_start(session, trace_config_ctx, params):
+    """aiohttp trace hook: remember when a connection attempt began"""
+    trace_config_ctx.connection_started = time.perf_counter()
+
+async def _on_connection_create_end(session, trace_config_ctx, params):
+    """aiohttp trace hook: count fresh connections and their setup time for the request being traced"""
+    ctx = trace_config_ctx.trace_request_ctx
+    if ctx is not None:
+        ctx['connections_opened'] = ctx.get('connections_opened', 0) + 1
+        # aiohttp resolves DNS and does the TLS handshake inside connection creation
+        ctx['setup_time'] = ctx.get('setup_time', 0.0) + time.perf_counter() - trace_config_ctx.connection_started
+
+def resolved_address(host):
+    """Address the async session's resolver last returned for host (an IP host is its own)"""
+    return host if is_ip_address(host) else _resolved_addresses.get(host)
+
+async def get_async_session(limit, headers=None):
+    """Get the shared aiohttp session (created on first use)"""
+    import aiohttp
+    global _async_session
+    
+    if _async_session is None or _async_session.closed:
+        class RecordingResolver(aiohttp.DefaultResolver):
+            """Remembers what each host resolved to, for probes that fail before or while connecting"""
+            
+            async def resolve(self, host, port=0, family=socket.AF_INET):
+                hosts = await super().resolve(host, port, family)
+                if hosts:
+                    _resolved_addresses[host] = hosts[0]['host']
+                return hosts
+        
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+        trace_config.on_connection_create_start.append(_on_connection_create_start)
+        trace_config.on_connection_create_end.append(_on_connection_create_end)
+        
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=HTTP_POOL_MAXSIZE,
+            ttl_dns_cache=300,
+            resolver=RecordingResolver()
+        )
+        # Bodies are only decoded when a content check needs it (see async_checker.read_body_async)
+        _async_session = aiohttp.ClientSession(
+            connector=connector,
+            headers=headers,
+            auto_decompress=False,
+            # As for the requests session, don't keep cookies between probes
+            cookie_jar=aiohttp.DummyCookieJar(),
+            trace_configs=[trace_config]
+        )
+    
+    return _async_session
+
+async def close_async_session():
+    """Close the shared aiohttp session"""
+    global _async_session
+    
+    if _async_session is not None and not _async_session.closed:
+        await _async_session.close()
+    _async_session = None
@@ -0,0 +1,230 @@
+import html
+import os
+import queue
+import smtplib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from dotenv import load_dotenv
+import requests
+from http_client import get_session
+from email_config import SMTPSession, build_email_message, email_configured
+
+# Load environment variables
+load_dotenv()
+
+# ===== TELEGRAM CONFIG =====
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')  # Point at a fake server to test
+TELEGRAM_MAX_LENGTH = 4096  # Longest text Telegram accepts in one message
+
+# ===== DISPATCHER CONFIG =====
+ALERT_DIGEST_WINDOW = float(os.getenv('ALERT_DIGEST_WINDOW', 10))  # Seconds to gather alerts into one digest
+ALERT_MAX_RETRIES = int(os.getenv('ALERT_MAX_RETRIES', 4))  # Attempts per channel before dropping a message
+ALERT_RETRY_BACKOFF = float(os.getenv('ALERT_RETRY_BACKOFF', 2))  # First retry delay, doubled each attempt
+SMTP_IDLE_TIMEOUT = 120  # Close the SMTP session after this many quiet seconds
+
+# One alert: the Telegram text (HTML) plus the email subject and HTML body
+Alert = namedtuple('Alert', ['message', 'email_subject', 'email_body'])
+
+class RetryableError(Exception):
+    """A send failed in a way worth retrying, optionally after a given delay"""
+    
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def is_retryable(error):
+    """Whether a failed send might succeed later: network trouble, rate limiting or a server error
+    
+    Anything else (a rejected token or chat id, failed SMTP login, refused
+    address) fails the same way every time.
+    """
+    if isinstance(error, RetryableError):
+        return True
+    # Both are OSError subclasses, so they are told apart before the network errors
+    if isinstance(error, requests.RequestException):
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 4xx replies are temporary, 5xx permanent
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException):
+        return isinstance(error, smtplib.SMTPServerDisconnected)
+    return isinstance(error, OSError)
+
+def telegram_configured():
+    """Whether there is a bot and chat to send Telegram alerts to"""
+    return bool(TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID)
+
+def send_telegram_message(message):
+    """Send one Telegram message, raising if the API didn't accept it"""
+    url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    data = {
+        "chat_id": TELEGRAM_CHAT_ID,
+        "text": message,
+        "parse_mode": "HTML"
+    }
+    
+    response = get_session().post(url, data=data, timeout=10)
+    if response.status_code == 429 or response.status_code >= 500:
+        # Rate limited or Telegram having trouble; it says how long to wait
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after')
+        except ValueError:
+            retry_after = None
+        raise RetryableError(f"Telegram returned {response.status_code}", retry_after)
+    response.raise_for_status()
+
+def split_message(text, limit=TELEGRAM_MAX_LENGTH):
+    """Split text into chunks Telegram accepts, preferring paragraph breaks"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        chunks.append(text)
+    return chunks
+
+def format_digest(alerts):
+    """Combine alerts into one Telegram text and one email (subject, body)"""
+    separator = '\n\n━━━━━━━━━━━━━━━━━━━━\n\n'
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    message = f"🔔 <b>{len(alerts)} alerts</b> ({now})" + separator + separator.join(alert.message for alert in alerts)
+    
+    sections = ''.join(f"""
+                <div style="margin-top: 20px; padding: 15px; background: #f9fafb; border-radius: 8px;">
+                    <h3>{html.escape(alert.email_subject)}</h3>
+                    <p>{alert.message.replace(chr(10), '<br>')}</p>
+                </div>""" for alert in alerts)
+    subject = f"🔔 {len(alerts)} site monitor alerts"
+    body = f"""
+            <html>
+            <body style="font-family: Arial, sans-serif; padding: 20px;">
+                <div style="background: #1f2937; color: white; padding: 20px; border-radius: 10px;">
+                    <h2>🔔 {len(alerts)} alerts</h2>
+                    <p>{now}</p>
+                </div>{sections}
+            </body>
+            </html>
+            """
+    return message, subject, body
+
+class AlertDispatcher:
+    """Sends alerts from a background thread so checks never wait on Telegram or SMTP
+    
+    Alerts queued within digest_window seconds of each other go out as one
+    digest per channel. Sends that failed for a temporary reason (see
+    is_retryable) are retried with exponential backoff; the SMTP session
+    stays open between alerts and is closed when idle.
+    """
+    
+    def __init__(self, digest_window=ALERT_DIGEST_WINDOW, max_retries=ALERT_MAX_RETRIES, retry_backoff=ALERT_RETRY_BACKOFF):
+        self.digest_window = digest_window
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._smtp = SMTPSession()
+    
+    def notify(self, message, email_subject, email_body):
+        """Queue an alert for both channels and return immediately"""
+        self._ensure_started()
+        self._queue.put(Alert(message, email_subject, email_body))
+    
+    def close(self):
+        """Send whatever is queued, then stop the thread and the SMTP session"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+    
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=SMTP_IDLE_TIMEOUT if self._smtp.connected else None)
+            except queue.Empty:
+                self._smtp.close()
+                continue
+            
+            batch = [first]
+            stopping = first is None
+            
+            # Gather everything else that arrives within the digest window
+            deadline = time.monotonic() + self.digest_window
+            while not stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    alert = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(alert)
+                stopping = alert is None
+            
+            alerts = [alert for alert in batch if alert is not None]
+            try:
+                if alerts:
+                    self._deliver(alerts)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            
+            if stopping:
+                self._smtp.close()
+                return
+    
+    def _deliver(self, alerts):
+        """Send a batch of alerts, as a digest when there is more than one"""
+        if len(alerts) == 1:
+            message, email_subject, email_body = alerts[0]
+        else:
+            message, email_subject, email_body = format_digest(alerts)
+        
+        if telegram_configured():
+            for chunk in split_message(message):
+                if self._send_with_retry('Telegram', send_telegram_message, chunk):
+                    print(f"📱 Telegram alert sent ({len(alerts)} alert{'s' if len(alerts) > 1 else ''})")
+        
+        if email_configured():
+            email = build_email_message(email_subject, email_body)
+            if self._send_with_retry('email', self._smtp.send, email):
+                print(f"📧 Email alert sent ({len(alerts)} alert{'s' if len(alerts) > 1 else ''})")
+    
+    def _send_with_retry(self, channel, send, payload):
+        """Call send(payload), retrying with exponential backoff; returns whether it succeeded"""
+        for attempt in range(self.max_retries):
+            try:
+                send(payload)
+                return True
+            except Exception as e:
+                if not is_retryable(e):
+                    print(f"Failed to send {channel} alert: {e}")
+                    return False
+                if attempt == self.max_retries - 1:
+                    print(f"Failed to send {channel} alert after {self.max_retries} attempts: {e}")
+                    return False
+                
+                delay = getattr(e, 'retry_after', None) or self.retry_backoff * 2 ** attempt
+                print(f"Failed to send {channel} alert ({e}), retrying in {delay:.0f}s...")
+                if channel == 'email':
+                    # Start the next attempt on a fresh connection
+                    self._smtp.close()
+                time.sleep(delay)
+        return False
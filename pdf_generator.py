@@ -5,41 +5,109 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from datetime import datetime, timedelta
-from database import get_stats, get_recent_checks, get_checks_by_date_range, get_overall_stats
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import database
+from database import (get_all_stats, get_recent_checks, get_overall_stats, get_rollups,
+                      get_rollup_versions, ROLLUP_TABLES)
 from sites_config import load_sites
 import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
 from io import BytesIO
+from dotenv import load_dotenv
 
-def create_response_time_chart_image(url, days=7):
-    """Create a response time chart as an image for PDF"""
-    from datetime import datetime, timedelta
-    import sqlite3
-    
-    # Get data for the specified period
-    conn = sqlite3.connect('monitor.db')
-    cursor = conn.cursor()
-    
-    since = datetime.now() - timedelta(days=days)
-    
-    cursor.execute('''
-        SELECT timestamp, response_time
-        FROM checks
-        WHERE url = ? AND timestamp > ? AND status = 'up' AND response_time IS NOT NULL
-        ORDER BY timestamp ASC
-    ''', (url, since))
-    
-    results = cursor.fetchall()
-    conn.close()
+# Load environment variables
+load_dotenv()
+
+# ===== REPORT CONFIG =====
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', os.cpu_count() or 1))  # Processes rendering site sections in parallel
+REPORT_POOL_MIN_SITES = 4  # Smaller reports are rendered in-process (starting workers costs more)
+CHART_CACHE_MAX_BYTES = int(os.getenv('CHART_CACHE_MAX_BYTES', 67108864))  # Rendered chart PNGs kept in memory for later reports
+CHART_CACHE_MAX_ENTRIES = int(os.getenv('CHART_CACHE_MAX_ENTRIES', 4096))  # Cap on cached charts, including sites with too little data for one
+
+_report_pool = None
+_report_pool_lock = threading.Lock()
+
+class ChartCache:
+    """Least-recently-used cache of rendered chart PNGs, bounded by their total size and count
+    
+    Keys include the data version they were rendered from, so an entry is
+    never stale; charts of changed data just stop being asked for and age
+    out.
+    """
+    
+    def __init__(self, max_bytes=CHART_CACHE_MAX_BYTES, max_entries=CHART_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._charts = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._charts)
+    
+    def lookup(self, key):
+        """(True, PNG bytes or None for "no chart") if cached, else (False, None)"""
+        with self._lock:
+            if key not in self._charts:
+                self.misses += 1
+                return False, None
+            self._charts.move_to_end(key)
+            self.hits += 1
+            return True, self._charts[key]
+    
+    def store(self, key, png):
+        """Cache a chart (None records that there was too little data for one)"""
+        size = len(png) if png else 0
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            if key in self._charts:
+                old = self._charts.pop(key)
+                self.size -= len(old) if old else 0
+            self._charts[key] = png
+            self.size += size
+            # "No chart" entries have no size, so the count bounds them
+            while self.size > self.max_bytes or len(self._charts) > self.max_entries:
+                _, evicted = self._charts.popitem(last=False)
+                self.size -= len(evicted) if evicted else 0
+
+chart_cache = ChartCache()
+
+def chart_window(days, until=None):
+    """(granularity, since) of the chart covering the days before until (default now)"""
+    # Hourly points for up to a month, daily beyond that, so a long report
+    # reads O(days) rollup rows instead of every check
+    granularity = 'hour' if days <= 31 else 'day'
+    return granularity, (until or datetime.now()) - timedelta(days=days)
+
+def create_response_time_chart_image(url, days=7, since=None, until=None):
+    """Create a response time chart as an image for PDF (since defaults to days before until, or now)"""
+    granularity, default_since = chart_window(days, until)
+    since = since or default_since
+    
+    # get_rollups includes the bucket until falls in, which starts at until itself
+    last_bucket = until - timedelta(seconds=1) if until else None
+    results = [
+        row for row in get_rollups(url, since, granularity=granularity, until=last_bucket)
+        if row['avg_response_time'] is not None
+    ]
     
     if not results or len(results) < 2:
         return None
     
     # Extract data
-    timestamps = [datetime.fromisoformat(row[0]) for row in results]
-    response_times = [row[1] * 1000 for row in results]  # Convert to ms
+    timestamps = [datetime.fromisoformat(row['bucket']) for row in results]
+    response_times = [row['avg_response_time'] * 1000 for row in results]  # Convert to ms
     
     # Create chart
     fig, ax = plt.subplots(figsize=(6, 3), facecolor='white')
@@ -66,8 +134,96 @@ def create_response_time_chart_image(url, days=7):
     
     return img_buffer
 
-def generate_uptime_report(days=7):
-    """Generate a comprehensive uptime report as PDF"""
+def init_report_worker(db_file):
+    """Point a report worker at the same database as the process that started it"""
+    database.DB_FILE = db_file
+
+def get_report_pool():
+    """Process pool for site sections, started on first use and kept for later reports"""
+    global _report_pool
+    
+    with _report_pool_lock:
+        if _report_pool is None:
+            # Spawned, not forked: matplotlib and the web server's threads don't survive a fork
+            _report_pool = ProcessPoolExecutor(
+                max_workers=REPORT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_report_worker,
+                initargs=(database.DB_FILE,)
+            )
+        return _report_pool
+
+def discard_report_pool(pool):
+    """Shut down a broken pool so the next get_report_pool() starts a fresh one"""
+    global _report_pool
+    
+    with _report_pool_lock:
+        if _report_pool is pool:
+            _report_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def render_site_section(url, days, since=None, chart=True, until=None):
+    """The slow, per-site part of a report: (chart PNG bytes or None, recent checks)
+    
+    With chart=False only the recent checks are fetched (the chart was
+    cached). Runs in a report worker; returns plain data so it pickles cheaply.
+    """
+    chart_img = create_response_time_chart_image(url, days=days, since=since, until=until) if chart else None
+    return (chart_img.getvalue() if chart_img else None), get_recent_checks(url, limit=10, until=until)
+
+def render_site_sections(sites, days, progress=None, until=None):
+    """render_site_section() for every site, across the report workers, in site order
+    
+    Charts whose data hasn't changed since an earlier report come from
+    chart_cache instead of being drawn again. progress, if given, is called
+    with (sections done, total) as they arrive. until ends the period
+    covered (default now).
+    """
+    # A chart is identified by its site, window (to the bucket) and rollup data version
+    granularity, since = chart_window(days, until)
+    since_bucket = since.strftime(ROLLUP_TABLES[granularity][1])
+    versions = get_rollup_versions(sites, granularity)
+    keys = [(url, days, since_bucket, until, versions.get(url)) for url in sites]
+    cached = [chart_cache.lookup(key) for key in keys]
+    render_chart = [not hit for hit, _ in cached]
+    
+    args = (sites, [days] * len(sites), [since] * len(sites), render_chart, [until] * len(sites))
+    pool = None
+    sections = []
+    try:
+        if REPORT_WORKERS <= 1 or sum(render_chart) < REPORT_POOL_MIN_SITES:
+            results = map(render_site_section, *args)
+        else:
+            # A few sites per task keeps the pickling overhead down without starving workers
+            chunksize = max(1, len(sites) // (REPORT_WORKERS * 4))
+            pool = get_report_pool()
+            results = pool.map(render_site_section, *args, chunksize=chunksize)
+        
+        for key, (hit, cached_png), (chart_png, recent) in zip(keys, cached, results):
+            if hit:
+                chart_png = cached_png
+            else:
+                chart_cache.store(key, chart_png)
+            sections.append((chart_png, recent))
+            if progress:
+                progress(len(sections), len(sites))
+    except BrokenProcessPool:
+        # A worker died (killed or out of memory); the pool can't run anything else
+        discard_report_pool(pool)
+        raise
+    return sections
+
+def generate_uptime_report(days=7, sites=None, progress=None, until=None):
+    """Generate a comprehensive uptime report as PDF
+    
+    Covers the given sites (default every monitored site) over the days
+    before until (default now; a past until, to the hour, gives a report of
+    a closed period that later checks don't change). progress, if given, is
+    called with (steps done, total steps): one step per site section and one
+    for laying out the document.
+    """
+    
+    sites = load_sites() if sites is None else list(sites)
     
     # Create PDF in memory
     buffer = io.BytesIO()
@@ -115,11 +271,12 @@ def generate_uptime_report(days=7):
     elements.append(title)
     
     # Report metadata
-    end_date = datetime.now()
+    generated = datetime.now()
+    end_date = until or generated
     start_date = end_date - timedelta(days=days)
     
     metadata_text = f"""<b>Report Period:</b> {start_date.strftime('%B %d, %Y')} - {end_date.strftime('%B %d, %Y')}<br/>
-    <b>Generated:</b> {end_date.strftime('%B %d, %Y at %H:%M:%S')}<br/>
+    <b>Generated:</b> {generated.strftime('%B %d, %Y at %H:%M:%S')}<br/>
     <b>Coverage:</b> Last {days} days"""
     
     metadata = Paragraph(metadata_text, normal_style)
@@ -127,7 +284,7 @@ def generate_uptime_report(days=7):
     elements.append(Spacer(1, 0.3*inch))
     
     # Overall statistics
-    overall_stats = get_overall_stats()
+    overall_stats = get_overall_stats(sites, until=until)
     
     summary_heading = Paragraph("Executive Summary", heading_style)
     elements.append(summary_heading)
@@ -162,14 +319,22 @@ def generate_uptime_report(days=7):
     elements.append(Spacer(1, 0.3*inch))
     
     # Individual site reports
-    sites = load_sites()
-    
-    for idx, url in enumerate(sites):
+    all_stats = get_all_stats(sites, until=until)  # One query for every site
+    # Charts and recent checks for every site, rendered in parallel
+    section_progress = progress and (lambda done, total: progress(done, total + 1))
+    try:
+        sections = render_site_sections(sites, days, section_progress, until)
+    except BrokenProcessPool as e:
+        # Once more on a fresh pool; charts finished before the failure are cached
+        print(f"⚠️ Report workers failed ({e}), retrying with a new pool")
+        sections = render_site_sections(sites, days, section_progress, until)
+    
+    for idx, (url, (chart_png, recent)) in enumerate(zip(sites, sections)):
         # Page break between sites (except first)
         if idx > 0:
             elements.append(PageBreak())
         
-        stats = get_stats(url)
+        stats = all_stats[url]
         
         # Site heading
         site_heading = Paragraph(f"Site Report: {url}", heading_style)
@@ -208,10 +373,8 @@ def generate_uptime_report(days=7):
         chart_subheading = Paragraph("Response Time Analysis", subheading_style)
         elements.append(chart_subheading)
         
-        chart_img = create_response_time_chart_image(url, days=days)
-        
-        if chart_img:
-            img = Image(chart_img, width=5.5*inch, height=2.75*inch)
+        if chart_png:
+            img = Image(BytesIO(chart_png), width=5.5*inch, height=2.75*inch)
             elements.append(img)
         else:
             no_data = Paragraph("<i>Insufficient data for chart generation</i>", normal_style)
@@ -223,8 +386,6 @@ def generate_uptime_report(days=7):
         history_subheading = Paragraph("Recent Check History", subheading_style)
         elements.append(history_subheading)
         
-        recent = get_recent_checks(url, limit=10)
-        
         if recent:
             history_data = [['Time', 'Status', 'Response Time', 'Status Code']]
             
@@ -277,6 +438,8 @@ def generate_uptime_report(days=7):
     
     # Build PDF
     doc.build(elements)
+    if progress:
+        progress(len(sites) + 1, len(sites) + 1)
     
     # Get PDF data
     pdf_data = buffer.getvalue()
@@ -0,0 +1,298 @@
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from database import get_latest_check_id
+from pdf_generator import generate_uptime_report
+from sites_config import load_sites
+
+# Load environment variables
+load_dotenv()
+
+# ===== REPORT JOBS CONFIG =====
+REPORTS_DIR = os.getenv('REPORTS_DIR', 'reports')  # Where finished report PDFs are stored
+REPORT_REUSE_WINDOW = float(os.getenv('REPORT_REUSE_WINDOW', 300))  # Seconds a finished report is handed out again for the same request
+REPORT_SCHEDULE_HOUR = int(os.getenv('REPORT_SCHEDULE_HOUR', 3))  # Local hour (off-peak) the daily and weekly reports are pre-built
+REPORT_JOBS_KEPT = 50  # Finished on-demand jobs (and their PDFs) kept before the oldest are deleted
+WEEKLY_REPORT_WEEKDAY = 0  # Day the weekly report is pre-built (Monday)
+
+SCHEDULED_REPORTS = (1, 7)  # Days covered by the pre-built daily and weekly reports
+
+class ReportJob:
+    """One PDF report being (or already) generated"""
+    
+    def __init__(self, days, sites, data_version, scheduled=False, until=None):
+        """sites is a sorted tuple of URLs (None if not known, for reports found on disk)
+        
+        until ends the period covered; None means up to when it is generated.
+        """
+        self.id = secrets.token_hex(8)
+        self.days = days
+        self.sites = sites
+        self.data_version = data_version
+        self.scheduled = scheduled
+        self.until = until
+        self.status = 'queued'  # queued -> running -> done or failed
+        self.progress = 0.0
+        self.error = None
+        self.path = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.finished_monotonic = None
+    
+    @property
+    def key(self):
+        """Jobs with the same key produce the same report"""
+        return (self.days, self.sites, self.until)
+    
+    @property
+    def filename(self):
+        """Download name of the finished PDF"""
+        return f"uptime_report_{self.days}days_{self.created_at.strftime('%Y%m%d_%H%M%S')}.pdf"
+    
+    def to_dict(self):
+        """JSON-friendly status for polling"""
+        return {
+            'id': self.id,
+            'days': self.days,
+            'sites': len(self.sites) if self.sites is not None else None,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'error': self.error,
+            'scheduled': self.scheduled,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'download_url': f"/reports/{self.id}/download" if self.status == 'done' else None
+        }
+
+class ReportJobQueue:
+    """Generates PDF reports one at a time on a background thread
+    
+    Identical requests (days, site set) share a job: one still queued or
+    running, or one finished within reuse_window seconds, or finished with
+    no checks saved since. Finished PDFs are stored in reports_dir. A second
+    thread pre-builds the daily and weekly reports at schedule_hour, each
+    covering the period that ended then, so later checks don't make them
+    stale: the dashboard hands one out until the next run replaces it.
+    """
+    
+    def __init__(self, reports_dir=REPORTS_DIR, reuse_window=REPORT_REUSE_WINDOW, schedule_hour=REPORT_SCHEDULE_HOUR):
+        self.reports_dir = reports_dir
+        self.reuse_window = reuse_window
+        self.schedule_hour = schedule_hour
+        self._jobs = {}
+        self._scheduled = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = None
+    
+    def submit(self, days, sites=None, scheduled=False, until=None):
+        """Queue a report (default every monitored site), or return the job already producing it"""
+        self.start()
+        sites = tuple(sorted(load_sites() if sites is None else sites))
+        data_version = get_latest_check_id()
+        
+        with self._lock:
+            if not scheduled:
+                for job in self._jobs.values():
+                    if job.key == (days, sites, until) and self._reusable(job, data_version):
+                        return job
+            
+            job = ReportJob(days, sites, data_version, scheduled, until)
+            self._jobs[job.id] = job
+            self._queue.put(job)
+            return job
+    
+    def get(self, job_id):
+        """Job by id (None if unknown or already deleted)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def latest_scheduled(self, days):
+        """The pre-built report covering days if it is finished and from the latest run, else None"""
+        self.start()
+        with self._lock:
+            job = self._scheduled.get(days)
+        if job is None or job.status != 'done' or job.until is None or job.until < self._last_run(days, datetime.now()):
+            return None
+        return job
+    
+    def _reusable(self, job, data_version):
+        """Whether a job with the same key can stand in for a new request"""
+        if job.status in ('queued', 'running'):
+            return True
+        if job.status != 'done':
+            return False
+        return job.data_version == data_version or time.monotonic() - job.finished_monotonic <= self.reuse_window
+    
+    def _scheduled_path(self, days):
+        return os.path.join(self.reports_dir, f"scheduled_{days}days.pdf")
+    
+    def _info_path(self, days):
+        """What a pre-built report was generated from, stored next to its PDF"""
+        return os.path.join(self.reports_dir, f"scheduled_{days}days.json")
+    
+    def _remove_leftovers(self):
+        """Delete files no job can refer to: on-demand PDFs and partial writes from an earlier run"""
+        kept = set()
+        for days in SCHEDULED_REPORTS:
+            kept.add(os.path.basename(self._scheduled_path(days)))
+            kept.add(os.path.basename(self._info_path(days)))
+        
+        for name in os.listdir(self.reports_dir):
+            path = os.path.join(self.reports_dir, name)
+            if name not in kept and os.path.isfile(path):
+                os.remove(path)
+    
+    def _load_scheduled(self):
+        """Pick up pre-built reports stored by an earlier run"""
+        for days in SCHEDULED_REPORTS:
+            path = self._scheduled_path(days)
+            if not os.path.exists(path):
+                continue
+            
+            # Without its info (e.g. stopped mid-write) the period is unknown, so it is rebuilt
+            try:
+                with open(self._info_path(days), 'r') as f:
+                    info = json.load(f)
+                sites, until = tuple(info['sites']), datetime.fromisoformat(info['until'])
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            
+            job = ReportJob(days, sites, None, scheduled=True, until=until)
+            job.path = path
+            job.progress = 1.0
+            job.created_at = job.finished_at = datetime.fromtimestamp(os.path.getmtime(path))
+            job.finished_monotonic = time.monotonic() - (datetime.now() - job.finished_at).total_seconds()
+            job.status = 'done'
+            self._jobs[job.id] = job
+            self._scheduled[days] = job
+    
+    def start(self):
+        """Clear out leftovers, load stored reports and start the job and schedule threads (once)"""
+        with self._lock:
+            if self._threads is None:
+                os.makedirs(self.reports_dir, exist_ok=True)
+                self._remove_leftovers()
+                self._load_scheduled()
+                self._threads = [
+                    threading.Thread(target=self._run, name="report-jobs", daemon=True),
+                    threading.Thread(target=self._run_schedule, name="report-schedule", daemon=True)
+                ]
+                for thread in self._threads:
+                    thread.start()
+    
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._generate(job)
+            finally:
+                self._queue.task_done()
+    
+    def _generate(self, job):
+        """Generate one job's PDF into reports_dir"""
+        job.status = 'running'
+        
+        def progress(done, total):
+            job.progress = done / total
+        
+        try:
+            pdf_data = generate_uptime_report(days=job.days, sites=job.sites, progress=progress, until=job.until)
+            
+            # A new pre-built report replaces the previous one's file
+            path = self._scheduled_path(job.days) if job.scheduled else os.path.join(self.reports_dir, f"{job.id}.pdf")
+            if job.scheduled:
+                # Drop the old info first so it never describes the new PDF
+                try:
+                    os.remove(self._info_path(job.days))
+                except FileNotFoundError:
+                    pass
+            self._write(path, pdf_data)
+            if job.scheduled:
+                info = {'sites': list(job.sites), 'until': job.until.isoformat()}
+                self._write(self._info_path(job.days), json.dumps(info).encode())
+        except Exception as e:
+            print(f"❌ Report {job.id} ({job.days} days) failed: {e}")
+            job.error = str(e)
+            status = 'failed'
+        else:
+            job.path = path
+            job.progress = 1.0
+            status = 'done'
+        
+        # Finish times first: pollers treat a done job as having them
+        job.finished_at = datetime.now()
+        job.finished_monotonic = time.monotonic()
+        job.status = status
+        
+        with self._lock:
+            if job.scheduled and job.status == 'done':
+                replaced = self._scheduled.get(job.days)
+                self._scheduled[job.days] = job
+                if replaced is not None:
+                    self._jobs.pop(replaced.id, None)
+            self._prune()
+    
+    def _write(self, path, data):
+        """Replace a file atomically"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    
+    def _prune(self):
+        """Delete the oldest finished on-demand jobs beyond REPORT_JOBS_KEPT"""
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished_at and not job.scheduled),
+            key=lambda job: job.finished_at
+        )
+        for job in finished[:max(len(finished) - REPORT_JOBS_KEPT, 0)]:
+            self._delete(job)
+        
+        # Scheduled jobs that failed are not kept
+        for job in [job for job in self._jobs.values() if job.scheduled and job.status == 'failed']:
+            self._delete(job)
+    
+    def _delete(self, job):
+        self._jobs.pop(job.id, None)
+        if job.path:
+            try:
+                os.remove(job.path)
+            except FileNotFoundError:
+                pass
+    
+    def _next_run(self, now):
+        """Next schedule_hour o'clock after now"""
+        run_at = now.replace(hour=self.schedule_hour, minute=0, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        return run_at
+    
+    def _last_run(self, days, now):
+        """When the report covering days was last due to be built (at or before now)"""
+        run_at = self._next_run(now) - timedelta(days=1)
+        if days == 7:
+            run_at -= timedelta(days=(run_at.weekday() - WEEKLY_REPORT_WEEKDAY) % 7)
+        return run_at
+    
+    def _run_schedule(self):
+        # Catch up on runs missed while the dashboard was down
+        now = datetime.now()
+        for days in SCHEDULED_REPORTS:
+            if self.latest_scheduled(days) is None:
+                self.submit(days, scheduled=True, until=self._last_run(days, now))
+        
+        while True:
+            run_at = self._next_run(datetime.now())
+            time.sleep(max((run_at - datetime.now()).total_seconds(), 0))
+            
+            self.submit(1, scheduled=True, until=run_at)
+            if run_at.weekday() == WEEKLY_REPORT_WEEKDAY:
+                self.submit(7, scheduled=True, until=run_at)
+
+report_jobs = ReportJobQueue()
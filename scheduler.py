@@ -0,0 +1,148 @@
+import heapq
+import os
+import random
+import time
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ===== SCHEDULER CONFIG =====
+CHECK_MIN_INTERVAL = float(os.getenv('CHECK_MIN_INTERVAL', 60))  # Seconds between checks of a failing site
+CHECK_MAX_INTERVAL = float(os.getenv('CHECK_MAX_INTERVAL', 900))  # Longest a stable site waits between checks
+CHECK_JITTER = float(os.getenv('CHECK_JITTER', 0.1))  # Random delay, as a fraction of the interval, added to each check
+STABLE_AFTER = 12  # Successes in a row before a site's interval starts growing
+BACKOFF_FACTOR = 1.5  # Interval growth per further success once stable
+
+class SiteState:
+    """Scheduling state of one site"""
+    
+    __slots__ = ('url', 'base_interval', 'interval', 'due', 'successes', 'generation')
+    
+    def __init__(self, url, base_interval):
+        self.url = url
+        self.base_interval = base_interval
+        self.interval = base_interval
+        self.due = None
+        self.successes = 0
+        self.generation = 0
+
+class SiteScheduler:
+    """Decides when each site is checked next
+    
+    Sites sit in a heap keyed on their next check time. Each new site starts
+    at a random phase within its interval so checks spread evenly instead of
+    bursting together. Due times advance by exactly one interval from the
+    previous due time, so the period doesn't drift by however long a check
+    took; jitter delays each individual check but never accumulates.
+    
+    A failing site is rechecked every min_interval; once a site has
+    succeeded stable_after times in a row its interval grows by
+    backoff_factor per success, up to max_interval.
+    """
+    
+    def __init__(self, interval, min_interval=CHECK_MIN_INTERVAL, max_interval=CHECK_MAX_INTERVAL,
+                 jitter=CHECK_JITTER, stable_after=STABLE_AFTER, backoff_factor=BACKOFF_FACTOR):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, interval)
+        self.jitter = jitter
+        self.stable_after = stable_after
+        self.backoff_factor = backoff_factor
+        self._sites = {}
+        self._heap = []
+    
+    def __len__(self):
+        return len(self._sites)
+    
+    def __contains__(self, url):
+        return url in self._sites
+    
+    def _push(self, state):
+        """Queue a site's next check at its due time plus jitter"""
+        state.generation += 1
+        fire_at = state.due + random.uniform(0, self.jitter * state.interval)
+        heapq.heappush(self._heap, (fire_at, state.generation, state.url))
+    
+    def add(self, url, interval=None, now=None):
+        """Start scheduling a site at a random phase within its interval
+        
+        For a site already scheduled, only its base interval is updated (None
+        means the scheduler's default); the new cadence applies from its next
+        check.
+        """
+        now = time.monotonic() if now is None else now
+        interval = interval or self.interval
+        state = self._sites.get(url)
+        if state is None:
+            state = SiteState(url, interval)
+            self._sites[url] = state
+            state.due = now + random.uniform(0, state.interval)
+            self._push(state)
+        elif interval != state.base_interval:
+            state.base_interval = interval
+            state.interval = interval
+            state.successes = 0
+    
+    def remove(self, url):
+        """Stop scheduling a site (its queued entry is skipped when popped)"""
+        self._sites.pop(url, None)
+    
+    def pop_due(self, now=None):
+        """Take every site whose check is due; they stay out of the heap until record()"""
+        now = time.monotonic() if now is None else now
+        due = []
+        
+        while self._heap and self._heap[0][0] <= now:
+            _, generation, url = heapq.heappop(self._heap)
+            state = self._sites.get(url)
+            # Skip entries of removed sites and superseded entries
+            if state is None or state.generation != generation:
+                continue
+            due.append(url)
+        
+        return due
+    
+    def seconds_until_next(self, now=None):
+        """Seconds until the next check is due (None if nothing is scheduled)"""
+        now = time.monotonic() if now is None else now
+        
+        while self._heap:
+            _, generation, url = self._heap[0]
+            state = self._sites.get(url)
+            if state is not None and state.generation == generation:
+                return max(self._heap[0][0] - now, 0.0)
+            heapq.heappop(self._heap)
+        
+        return None
+    
+    def record(self, url, status, now=None):
+        """Reschedule a site after a check, adapting its interval to the outcome"""
+        now = time.monotonic() if now is None else now
+        state = self._sites.get(url)
+        if state is None:
+            return None
+        
+        previous_interval = state.interval
+        if status == 'up':
+            state.successes += 1
+            if state.successes > self.stable_after:
+                state.interval = min(state.interval * self.backoff_factor, max(self.max_interval, state.base_interval))
+            elif state.interval < state.base_interval:
+                # Recovered: back to the normal cadence
+                state.interval = state.base_interval
+        else:
+            state.successes = 0
+            state.interval = min(self.min_interval, state.base_interval)
+        
+        if state.interval != previous_interval:
+            print(f"⏱  {url}: now checking every {state.interval:.0f}s")
+        
+        state.due += state.interval
+        if state.due < now:
+            # Fell more than an interval behind (e.g. a slow check): skip ahead
+            # rather than firing a burst of catch-up checks
+            state.due = now
+        self._push(state)
+        
+        return state.interval
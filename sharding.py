@@ -0,0 +1,163 @@
+"""Run the checker as several shards that split the site list between them.
+
+Sites are assigned to workers by consistent hashing over the workers that
+heartbeat into the shared database, so each shard keeps its own schedule,
+write buffer and alert state, and only the sites of a worker that joins or
+leaves change hands. Shards can be local processes or run on several hosts
+that share sites.json and the database.
+    
+    python sharding.py --workers 4           # four local shards
+    python sharding.py --worker-id node-a    # one shard of a multi-host setup
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import socket
+import time
+from bisect import bisect
+from dotenv import load_dotenv
+from database import init_database, heartbeat_worker, get_live_workers, remove_worker
+from sites_config import registry
+
+# Load environment variables
+load_dotenv()
+
+# ===== SHARDING CONFIG =====
+SHARD_HEARTBEAT_INTERVAL = float(os.getenv('SHARD_HEARTBEAT_INTERVAL', 5))  # Seconds between a worker's heartbeats (sent when it polls sites.json)
+SHARD_WORKER_TIMEOUT = float(os.getenv('SHARD_WORKER_TIMEOUT', 20))  # Missed heartbeat time before a worker's sites move
+HASH_RING_REPLICAS = 128  # Points per worker on the hash ring; more spreads sites more evenly
+
+def ring_hash(key):
+    """Position of a key on the hash ring (stable across processes and hosts)"""
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+class HashRing:
+    """Consistent hash ring mapping site URLs to workers
+    
+    Each worker is placed at replicas points on the ring and a URL belongs
+    to the first worker point at or after its own hash, so adding or
+    removing a worker only moves about 1/N of the sites.
+    """
+    
+    def __init__(self, workers, replicas=HASH_RING_REPLICAS):
+        self.workers = sorted(workers)
+        points = sorted(
+            (ring_hash(f"{worker}#{replica}"), worker)
+            for worker in self.workers
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+    
+    def owner(self, url):
+        """Worker a URL is assigned to (None if the ring is empty)"""
+        if not self._owners:
+            return None
+        index = bisect(self._hashes, ring_hash(url)) % len(self._hashes)
+        return self._owners[index]
+
+class ShardWatcher:
+    """SiteWatcher for one shard: reports changes to the sites this worker owns
+    
+    poll() also heartbeats for the worker and re-reads the live workers at
+    most every heartbeat_interval seconds. Sites that move here when another
+    worker leaves are reported as added, and sites that move away when a
+    worker joins as removed, so refresh_sites() rebalances the scheduler.
+    """
+    
+    def __init__(self, worker_id, heartbeat_interval=SHARD_HEARTBEAT_INTERVAL, worker_timeout=SHARD_WORKER_TIMEOUT):
+        self.worker_id = worker_id
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_timeout = worker_timeout
+        self.ring = HashRing([worker_id])
+        self._next_heartbeat = 0
+        self._version = None
+        self._known = {}
+    
+    def _heartbeat(self):
+        """Heartbeat and rebuild the ring if workers joined or left; returns whether they did"""
+        now = time.monotonic()
+        if now < self._next_heartbeat:
+            return False
+        self._next_heartbeat = now + self.heartbeat_interval
+        
+        heartbeat_worker(self.worker_id, socket.gethostname(), os.getpid())
+        workers = set(get_live_workers(self.worker_timeout))
+        workers.add(self.worker_id)
+        if sorted(workers) == self.ring.workers:
+            return False
+        
+        self.ring = HashRing(workers)
+        print(f"🔀 Shard {self.worker_id}: {len(workers)} workers live ({', '.join(self.ring.workers)})")
+        return True
+    
+    def poll(self):
+        """(added, removed, changed) URLs of this shard since the previous poll"""
+        rebalanced = self._heartbeat()
+        configs, version = registry.snapshot()
+        if version == self._version and not rebalanced:
+            return [], [], []
+        
+        owned = {url: site for url, site in configs.items() if self.ring.owner(url) == self.worker_id}
+        added = [url for url in owned if url not in self._known]
+        removed = [url for url in self._known if url not in owned]
+        changed = [url for url, site in owned.items() if url in self._known and self._known[url] != site]
+        self._version = version
+        self._known = owned
+        return added, removed, changed
+    
+    def close(self):
+        """Leave the ring so the other workers pick up this shard's sites immediately"""
+        remove_worker(self.worker_id)
+
+def run_worker(worker_id):
+    """Run one shard of the checker until it is interrupted"""
+    # Imported here so spawned workers set up the checker's state in their own process
+    from checker import run_monitor
+    
+    watcher = ShardWatcher(worker_id)
+    try:
+        run_monitor(watcher)
+    finally:
+        watcher.close()
+
+def run_local_workers(count, prefix):
+    """Start count shards as local processes and wait for them (Ctrl+C stops all)"""
+    # Migrate once up front rather than racing in every worker
+    init_database()
+    
+    # Spawned, not forked, so no worker inherits another's sockets or threads
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_worker, args=(f"{prefix}-{index}",), name=f"shard-{index}")
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    print(f"🚀 Started {count} checker shards")
+    
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Ctrl+C reached every worker too; let them flush and deregister
+        for process in processes:
+            process.join()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='local shard processes to start')
+    parser.add_argument('--worker-id', help='run a single shard with this ID in this process (one per host)')
+    args = parser.parse_args()
+    
+    if args.worker_id:
+        try:
+            run_worker(args.worker_id)
+        except KeyboardInterrupt:
+            pass
+    else:
+        run_local_workers(max(args.workers, 1), socket.gethostname())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import math
+import threading
+from array import array
+from collections import namedtuple
+from database import get_recent_statuses, get_all_stats
+
+# Status codes stored in the ring buffer (0 = empty slot)
+STATUS_CODES = {'up': 1, 'warning': 2, 'down': 3}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# What a site looked like before the check being handled
+SiteSnapshot = namedtuple('SiteSnapshot', ['recent', 'failure_streak', 'total_checks', 'uptime_percentage'])
+
+class SiteStateStore:
+    """Last few statuses and latencies of every site, kept in memory
+
+    Each site gets a fixed slot in flat arrays (history entries of one byte
+    and one float each, plus a few counters), so 100k sites with the default
+    history of 8 fit in about 6 MB and answering "was it down?" or "how many
+    failures in a row?" needs no database query.
+    """
+    
+    def __init__(self, history=8):
+        self.history = history
+        self._slots = {}
+        self._statuses = array('b')
+        self._latencies = array('f')
+        self._next = array('H')  # Ring position the next result is written to
+        self._streak = array('I')  # Non-up results in a row, ending with the newest
+        self._total = array('I')
+        self._up = array('I')
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._slots)
+    
+    def __contains__(self, url):
+        return url in self._slots
+    
+    def _slot(self, url):
+        """Get (allocating if needed) the slot of a URL; caller holds the lock"""
+        slot = self._slots.get(url)
+        if slot is None:
+            slot = len(self._slots)
+            self._slots[url] = slot
+            self._statuses.frombytes(bytes(self.history))
+            self._latencies.extend([math.nan] * self.history)
+            for counter in (self._next, self._streak, self._total, self._up):
+                counter.append(0)
+        return slot
+    
+    def _push(self, slot, status, response_time):
+        """Append one result to a slot's ring; caller holds the lock"""
+        position = slot * self.history + self._next[slot]
+        self._statuses[position] = STATUS_CODES.get(status, STATUS_CODES['down'])
+        self._latencies[position] = math.nan if response_time is None else response_time
+        self._next[slot] = (self._next[slot] + 1) % self.history
+        self._streak[slot] = 0 if status == 'up' else self._streak[slot] + 1
+    
+    def _snapshot(self, slot):
+        """Current state of a slot, newest status first; caller holds the lock"""
+        base = slot * self.history
+        recent = []
+        for i in range(1, self.history + 1):
+            code = self._statuses[base + (self._next[slot] - i) % self.history]
+            if not code:
+                break
+            recent.append(STATUS_NAMES[code])
+        
+        total = self._total[slot]
+        uptime = self._up[slot] / total * 100 if total else 0
+        return SiteSnapshot(tuple(recent), self._streak[slot], total, uptime)
+    
+    def record(self, result):
+        """Add a check result, returning the SiteSnapshot from just before it"""
+        with self._lock:
+            slot = self._slot(result['url'])
+            previous = self._snapshot(slot)
+            self._push(slot, result['status'], result.get('response_time'))
+            self._total[slot] += 1
+            if result['status'] == 'up':
+                self._up[slot] += 1
+        return previous
+    
+    def snapshot(self, url):
+        """Current SiteSnapshot of a URL"""
+        with self._lock:
+            return self._snapshot(self._slot(url))
+    
+    def latencies(self, url):
+        """Response times in the ring, newest first (None for failed checks)"""
+        with self._lock:
+            slot = self._slot(url)
+            base = slot * self.history
+            values = []
+            for i in range(1, self.history + 1):
+                position = base + (self._next[slot] - i) % self.history
+                if not self._statuses[position]:
+                    break
+                value = self._latencies[position]
+                values.append(None if math.isnan(value) else value)
+            return values
+    
+    def warm(self, urls=None):
+        """Load recent history and totals from the database for sites not tracked yet
+
+        With urls=None every active site is loaded (one query each for the
+        history and the totals); returns how many sites were added.
+        """
+        recent = get_recent_statuses(urls, limit=self.history)
+        totals = get_all_stats(urls)
+        
+        added = 0
+        with self._lock:
+            for url, stats in totals.items():
+                if url in self._slots:
+                    continue
+                slot = self._slot(url)
+                for status, response_time in recent.get(url, []):
+                    self._push(slot, status, response_time)
+                self._total[slot] = stats['total_checks']
+                self._up[slot] = stats['successful_checks']
+                added += 1
+        return added
@@ -1,42 +1,275 @@
 import json
 import os
+import re
+import threading
+from collections import namedtuple
+from database import set_site_active, rename_site as rename_site_history
 
 CONFIG_FILE = "sites.json"
 
+# Monitored when there is no config file yet (not written to disk until a site is added)
+DEFAULT_SITES = [
+    "https://google.com",
+    "https://github.com",
+    "https://stackoverflow.com",
+]
+
+# How to probe one site. sites.json entries are either a plain URL (all
+# defaults) or an object with "url" plus any of the other fields:
+#   method            "GET" or "HEAD"
+#   timeout           seconds per attempt
+#   retries           attempts before the site counts as failing
+#   interval          seconds between checks (null = the monitor's CHECK_INTERVAL)
+#   expected_status   status code or list of codes that count as up
+#   max_body_bytes    stop reading the body after this many bytes (null = the monitor's MAX_BODY_BYTES)
+#   headers           extra request headers, overriding the defaults
+#   follow_redirects  follow 3xx responses
+#   expect_text       text the body must contain to count as up
+#   expect_regex      regular expression the body must match to count as up
+SiteConfig = namedtuple(
+    'SiteConfig',
+    ['url', 'method', 'timeout', 'retries', 'interval', 'expected_status', 'max_body_bytes', 'headers', 'follow_redirects',
+     'expect_text', 'expect_regex'],
+    defaults=['GET', 5, 3, None, (200,), None, None, True, None, None]
+)
+
+METHODS = ('GET', 'HEAD')
+
+def _is_int(value):
+    # bool is an int subclass, but true/false is never a valid number here
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_number(value):
+    return _is_int(value) or isinstance(value, float)
+
+def _check_type(url, field, value, valid, expected, optional=False):
+    """Raise ValueError naming the field unless value passes valid (or is null when optional)"""
+    if value is None and optional:
+        return
+    if not valid(value):
+        raise ValueError(f"{field} for {url} must be {expected}{' or null' if optional else ''}, not {value!r}")
+
+def parse_site(entry):
+    """Build a SiteConfig from a sites.json entry, raising ValueError if it's invalid"""
+    if isinstance(entry, str):
+        entry = {'url': entry}
+    
+    if not isinstance(entry, dict) or not isinstance(entry.get('url'), str):
+        raise ValueError(f"Site entries must be a URL or an object with a url: {entry!r}")
+    
+    url = entry['url']
+    unknown = set(entry) - set(SiteConfig._fields)
+    if unknown:
+        raise ValueError(f"Unknown setting(s) for {url}: {', '.join(sorted(unknown))}")
+    
+    site = SiteConfig(**entry)
+    
+    _check_type(url, 'method', site.method, lambda value: isinstance(value, str), "a string")
+    _check_type(url, 'timeout', site.timeout, lambda value: _is_number(value) and value > 0, "a positive number")
+    _check_type(url, 'retries', site.retries, _is_int, "a whole number")
+    _check_type(url, 'interval', site.interval, lambda value: _is_number(value) and value > 0, "a positive number", optional=True)
+    _check_type(url, 'expected_status', site.expected_status,
+                lambda value: _is_int(value) or (isinstance(value, (list, tuple)) and value and all(map(_is_int, value))),
+                "a status code or a non-empty list of them")
+    _check_type(url, 'max_body_bytes', site.max_body_bytes, lambda value: _is_int(value) and value > 0, "a positive whole number", optional=True)
+    _check_type(url, 'headers', site.headers,
+                lambda value: isinstance(value, dict) and all(isinstance(name, str) and isinstance(header, (str, int, float)) for name, header in value.items()),
+                "an object of header names to values", optional=True)
+    _check_type(url, 'follow_redirects', site.follow_redirects, lambda value: isinstance(value, bool), "true or false")
+    
+    method = site.method.upper()
+    if method not in METHODS:
+        raise ValueError(f"Unsupported method for {url}: {site.method} (use {' or '.join(METHODS)})")
+    
+    expected_status = site.expected_status
+    if isinstance(expected_status, int):
+        expected_status = (expected_status,)
+    
+    retries = int(site.retries)
+    if retries < 1:
+        raise ValueError(f"retries for {url} must be at least 1")
+    
+    for field in ('expect_text', 'expect_regex'):
+        if getattr(site, field) is not None and not isinstance(getattr(site, field), str):
+            raise ValueError(f"{field} for {url} must be a string")
+    
+    if (site.expect_text or site.expect_regex) and method == 'HEAD':
+        raise ValueError(f"{url} checks the body (expect_text/expect_regex), so it can't use HEAD")
+    if site.expect_regex:
+        try:
+            re.compile(site.expect_regex.encode())
+        except re.error as e:
+            raise ValueError(f"Invalid expect_regex for {url}: {e}")
+    
+    return site._replace(
+        method=method,
+        timeout=float(site.timeout),
+        retries=retries,
+        interval=float(site.interval) if site.interval else None,
+        expected_status=tuple(int(code) for code in expected_status),
+        max_body_bytes=int(site.max_body_bytes) if site.max_body_bytes else None,
+        headers={str(name): str(value) for name, value in (site.headers or {}).items()},
+        follow_redirects=bool(site.follow_redirects)
+    )
+
+def entry_url(entry):
+    """URL of a raw sites.json entry"""
+    return entry['url'] if isinstance(entry, dict) else entry
+
+class SiteRegistry:
+    """Cached view of the site config file
+    
+    The file is only re-parsed when its mtime, size or inode change, so
+    reading the site list costs one stat() call. version increases with
+    every change that was picked up.
+    """
+    
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self.version = 0
+        self._entries = None
+        self._configs = {}
+        self._signature = None
+        self._lock = threading.Lock()
+    
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _refresh(self):
+        """Re-read the file if it changed since the last look"""
+        signature = self._file_signature()
+        
+        with self._lock:
+            if self._entries is None or signature != self._signature:
+                try:
+                    if signature is None:
+                        entries = list(DEFAULT_SITES)
+                    else:
+                        with open(self.path, 'r') as f:
+                            entries = json.load(f)
+                        if not isinstance(entries, list):
+                            raise ValueError("the top level must be a list of sites")
+                    configs = [parse_site(entry) for entry in entries] if entries != self._entries else None
+                except (OSError, ValueError, TypeError) as e:
+                    if self._entries is None:
+                        raise
+                    # Keep monitoring with the last good list until the file is fixed
+                    print(f"⚠️ Ignoring invalid {self.path}: {e}")
+                    self._signature = signature
+                    return self._configs, self.version
+                
+                if configs is not None:
+                    self._configs = {site.url: site for site in configs}
+                    self.version += 1
+                self._entries = entries
+                self._signature = signature
+            
+            return self._configs, self.version
+    
+    def snapshot(self):
+        """Current ({url: SiteConfig}, version), re-reading the file only if it changed"""
+        return self._refresh()
+    
+    def sites(self):
+        """Current site URLs (a list the caller may modify)"""
+        configs, _ = self._refresh()
+        return list(configs)
+    
+    def entries(self):
+        """Current raw sites.json entries (URLs or objects), for editing"""
+        self._refresh()
+        with self._lock:
+            return list(self._entries)
+    
+    def site_config(self, url):
+        """SiteConfig of a URL (defaults if it isn't configured)"""
+        configs, _ = self._refresh()
+        return configs.get(url) or parse_site(url)
+    
+    def save(self, entries):
+        """Write the site list, replacing the file atomically"""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(temp_path, self.path)
+        # Pick up our own write now rather than on the next stat
+        self._refresh()
+    
+    def watch(self):
+        """Get a SiteWatcher that reports changes from now on"""
+        return SiteWatcher(self)
+
+class SiteWatcher:
+    """Reports sites added, removed or reconfigured in a registry since the last poll"""
+    
+    def __init__(self, registry):
+        self.registry = registry
+        self._version = None
+        self._known = {}
+    
+    def poll(self):
+        """(added, removed, changed) URLs since the previous poll; all empty if nothing changed"""
+        configs, version = self.registry.snapshot()
+        if version == self._version:
+            return [], [], []
+        
+        added = [url for url in configs if url not in self._known]
+        removed = [url for url in self._known if url not in configs]
+        changed = [url for url, site in configs.items() if url in self._known and self._known[url] != site]
+        self._version = version
+        self._known = configs
+        return added, removed, changed
+
+registry = SiteRegistry()
+
 def load_sites():
-    """Load sites from config file"""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    else:
-        # Default sites
-        default_sites = [
-            "https://google.com",
-            "https://github.com",
-            "https://stackoverflow.com",
-        ]
-        save_sites(default_sites)
-        return default_sites
+    """Load site URLs from config file (cached until the file changes)"""
+    return registry.sites()
+
+def get_site_config(url):
+    """How to probe a site (see SiteConfig)"""
+    return registry.site_config(url)
 
 def save_sites(sites):
-    """Save sites to config file"""
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(sites, f, indent=2)
+    """Save sites (URLs and/or config objects) to config file"""
+    registry.save(sites)
 
 def add_site(url):
     """Add a new site to monitor"""
-    sites = load_sites()
-    if url not in sites:
-        sites.append(url)
-        save_sites(sites)
+    entries = registry.entries()
+    if url not in map(entry_url, entries):
+        entries.append(url)
+        save_sites(entries)
+        set_site_active(url, True)
         return True
     return False
 
 def remove_site(url):
     """Remove a site from monitoring"""
-    sites = load_sites()
-    if url in sites:
-        sites.remove(url)
-        save_sites(sites)
+    entries = registry.entries()
+    urls = [entry_url(entry) for entry in entries]
+    if url in urls:
+        del entries[urls.index(url)]
+        save_sites(entries)
+        # History is kept, the site is just no longer monitored
+        set_site_active(url, False)
         return True
-    return False
\ No newline at end of file
+    return False
+
+def rename_site(old_url, new_url):
+    """Change a monitored site's URL, keeping its check history and settings"""
+    entries = registry.entries()
+    urls = [entry_url(entry) for entry in entries]
+    if old_url not in urls or new_url in urls:
+        return False
+    if not rename_site_history(old_url, new_url):
+        return False
+    index = urls.index(old_url)
+    entry = entries[index]
+    entries[index] = dict(entry, url=new_url) if isinstance(entry, dict) else new_url
+    save_sites(entries)
+    return True
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import database
+import web_dashboard
+from web_dashboard import app, parse_datetime, parse_history_args, parse_incident_args
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Dashboard test client on an empty database with one site"""
+    monkeypatch.setattr(database, 'DB_FILE', str(tmp_path / 'monitor.db'))
+    database.init_database()
+    database.sync_sites(['https://example.com'])
+    monkeypatch.setattr(web_dashboard, 'load_sites', lambda: ['https://example.com'])
+    yield app.test_client()
+    database.close_connections()
+
+def test_parse_datetime_converts_offsets_to_naive_local_time():
+    parsed = parse_datetime('2024-01-01T12:00:00Z')
+    
+    assert parsed.tzinfo is None
+    assert parsed == datetime(2024, 1, 1, 12, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def test_parse_datetime_keeps_naive_values():
+    assert parse_datetime('2024-01-01T12:00:00') == datetime(2024, 1, 1, 12)
+
+def test_history_args_mix_aware_and_default_times():
+    since = (datetime.now(timezone.utc) - timedelta(hours=2)).isoformat()
+    
+    parsed_since, until, resolution = parse_history_args({'from': since})
+    
+    assert parsed_since < until
+    assert resolution == 'raw'
+
+def test_incident_args_accept_offsets():
+    filters = parse_incident_args({'from': '2024-01-01T00:00:00+02:00', 'to': '2024-01-02T00:00:00Z'})
+    
+    assert filters['since'].tzinfo is None
+    assert filters['until'].tzinfo is None
+
+def test_history_api_accepts_utc_from(client):
+    site_id = database.get_site_ids(['https://example.com'])['https://example.com']
+    since = (datetime.now(timezone.utc) - timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    
+    response = client.get(f'/api/sites/{site_id}/history?from={since}')
+    
+    assert response.status_code == 200
+
+def test_incidents_api_accepts_utc_range(client):
+    response = client.get('/api/incidents?from=2024-01-01T00:00:00Z&to=2024-01-02T00:00:00%2B02:00')
+    
+    assert response.status_code == 200
+
+@pytest.mark.parametrize('body', ['[7]', '"7"', '7', '{"sites": "1"}'])
+def test_submit_report_rejects_malformed_json(client, body):
+    response = client.post('/api/reports', data=body, content_type='application/json')
+    
+    assert response.status_code == 400
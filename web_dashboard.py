@@ -1,125 +1,261 @@
-from flask import Flask, request, redirect, send_file
-from database import get_stats, get_recent_checks, get_all_incidents, get_overall_stats
-import sqlite3
-from datetime import datetime, timedelta
-import plotly.graph_objects as go
-import plotly.io as pio
-from sites_config import load_sites, add_site, remove_site
-from pdf_generator import generate_uptime_report
-import io
+from flask import Flask, request, redirect, send_file, make_response, jsonify
+from database import (init_database, get_connection, get_all_stats, get_incidents_page, get_overall_stats, get_site_id, get_rollups,
+                      get_latest_check_id, get_site_ids, get_site_url)
+from datetime import datetime, timedelta, timezone
+from plotly.offline import get_plotlyjs_version
+from sites_config import load_sites, add_site, remove_site, registry
+from report_jobs import report_jobs, SCHEDULED_REPORTS
+from collections import namedtuple, OrderedDict
+from html import escape as html_escape
+import hashlib
+import os
+import threading
+import time
+from urllib.parse import urlencode
 
 app = Flask(__name__)
 
+# ===== PAGE CACHE =====
+PAGE_CACHE_MAX_AGE = 300  # Seconds a rendered page is reused while no new checks arrive (time windows still move)
+PAGE_CACHE_MAX_PAGES = 64  # Rendered pages (path + query) kept, least recently used dropped first
+
+# A rendered page and the data version it was rendered from
+CachedPage = namedtuple('CachedPage', ['version', 'html', 'etag', 'last_modified', 'rendered_at'])
+
+_page_cache = OrderedDict()
+_page_cache_lock = threading.Lock()
+
+def get_data_version():
+    """Changes whenever the checker saves results or the site list changes"""
+    _, sites_version = registry.snapshot()
+    return (get_latest_check_id(), sites_version)
+
+def cached_page(render):
+    """Serve render()'s HTML for this request's URL, re-rendering only when the data changed
+    
+    Pages carry an ETag and Last-Modified so a browser refreshing an
+    unchanged page gets a 304 with no body.
+    """
+    version = get_data_version()
+    key = request.full_path
+    
+    # One render at a time, so a burst of refreshes renders once
+    with _page_cache_lock:
+        page = _page_cache.get(key)
+        if page is None or page.version != version or time.monotonic() - page.rendered_at > PAGE_CACHE_MAX_AGE:
+            html = render()
+            page = CachedPage(
+                version=version,
+                html=html,
+                etag=hashlib.sha1(html.encode()).hexdigest(),
+                last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+                rendered_at=time.monotonic()
+            )
+            _page_cache[key] = page
+            if len(_page_cache) > PAGE_CACHE_MAX_PAGES:
+                _page_cache.popitem(last=False)
+        _page_cache.move_to_end(key)
+    
+    response = make_response(page.html)
+    response.set_etag(page.etag)
+    response.last_modified = page.last_modified
+    # Let browsers keep the page but ask every time whether it changed
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def conditional_json(build):
+    """Serve jsonify(build()) with an ETag, answering 304 without building it if the data hasn't changed"""
+    # The time window part expires relative ranges ("last 24 hours") like cached pages
+    window = int(time.time() // PAGE_CACHE_MAX_AGE)
+    etag = hashlib.sha1(f"{get_data_version()}/{window}/{request.full_path}".encode()).hexdigest()
+    
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+# ===== HISTORY API =====
+HISTORY_RESOLUTIONS = ('raw', 'hour', 'day')
+RAW_HISTORY_MAX_HOURS = 7 * 24  # Longest range served as individual checks
+AUTO_RAW_MAX_HOURS = 6  # resolution=auto uses raw checks up to this range...
+AUTO_HOURLY_MAX_HOURS = 14 * 24  # ...and hourly rollups up to this one, daily beyond
+
+# ===== INCIDENTS =====
+INCIDENTS_PAGE_SIZE = 50  # Status changes per timeline page
+API_MAX_PAGE_SIZE = 1000  # Largest limit /api/incidents accepts
+INCIDENT_STATUSES = ('up', 'down', 'warning')
+MIN_DURATION_CHOICES = [(60, '1 min'), (300, '5 min'), (900, '15 min'), (3600, '1 hour')]
+
+# Plotly.js matching the installed plotly, loaded by the page only once a chart is on screen
+PLOTLY_JS_URL = f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+
 def get_all_sites_status():
     """Get current status for all monitored sites"""
     sites_data = []
     sites_to_monitor = load_sites()  # Load from config
+    all_stats = get_all_stats(sites_to_monitor)  # One query for every site
+    site_ids = get_site_ids(sites_to_monitor)
     
     for url in sites_to_monitor:
-        stats = get_stats(url)
-        recent = get_recent_checks(url, limit=1)
-        
-        if recent:
-            last_check = recent[0]
-            last_status = last_check[1]
-            last_time = last_check[4]
-        else:
-            last_status = "unknown"
-            last_time = None
+        stats = all_stats[url]
         
         sites_data.append({
+            'id': site_ids.get(url),
             'url': url,
-            'status': last_status,
+            'status': stats['last_status'],
             'uptime': stats['uptime_percentage'],
             'total_checks': stats['total_checks'],
             'avg_response': stats['avg_response_time'],
-            'last_checked': last_time
+            'last_checked': stats['last_checked']
         })
     
     return sites_data
 
-def get_site_history(url, hours=24):
-    """Get check history for a site"""
-    conn = sqlite3.connect('monitor.db')
-    cursor = conn.cursor()
-    
-    since = datetime.now() - timedelta(hours=hours)
+def get_site_history(url, hours=24, since=None, until=None):
+    """Get check history for a site (the last hours, or from since until until)"""
+    site_id = get_site_id(url)
+    since = since or datetime.now() - timedelta(hours=hours)
+    until = until or datetime.now()
     
-    cursor.execute('''
-        SELECT timestamp, status, response_time, status_code
-        FROM checks
-        WHERE url = ? AND timestamp > ?
-        ORDER BY timestamp ASC
-    ''', (url, since))
-    
-    results = cursor.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT timestamp, status, response_time, status_code,
+                   dns_time, connect_time, tls_time, ttfb, download_time, reused_connection
+            FROM checks
+            WHERE site_id = ? AND timestamp > ? AND timestamp <= ?
+            ORDER BY timestamp ASC
+        ''', (site_id, since, until))
+        
+        results = cursor.fetchall()
     
     return [{
         'timestamp': row[0],
         'status': row[1],
         'response_time': row[2],
-        'status_code': row[3]
+        'status_code': row[3],
+        'dns_time': row[4],
+        'connect_time': row[5],
+        'tls_time': row[6],
+        'ttfb': row[7],
+        'download_time': row[8],
+        'reused_connection': bool(row[9]) if row[9] is not None else None
     } for row in results]
 
-def create_response_time_chart(url):
-    """Create a response time chart for the last 24 hours"""
-    history = get_site_history(url, hours=24)
-    
-    if not history:
-        return "<p style='color: #64748b; text-align: center;'>No data yet</p>"
-    
-    # Extract timestamps and response times
-    timestamps = []
-    response_times = []
-    
-    for check in history:
-        if check['response_time'] is not None:
-            timestamps.append(check['timestamp'])
-            response_times.append(check['response_time'] * 1000)  # Convert to milliseconds
-    
-    if not response_times:
-        return "<p style='color: #64748b; text-align: center;'>No successful checks yet</p>"
-    
-    # Create the chart
-    fig = go.Figure()
-    
-    fig.add_trace(go.Scatter(
-        x=timestamps,
-        y=response_times,
-        mode='lines+markers',
-        name='Response Time',
-        line=dict(color='#4f46e5', width=2),
-        marker=dict(size=6),
-        fill='tozeroy',
-        fillcolor='rgba(79, 70, 229, 0.1)'
-    ))
-    
-    fig.update_layout(
-        title='Response Time (Last 24 Hours)',
-        xaxis_title='Time',
-        yaxis_title='Response Time (ms)',
-        plot_bgcolor='rgba(15, 23, 42, 0.6)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(color='#e2e8f0'),
-        height=300,
-        margin=dict(l=50, r=20, t=40, b=40),
-        xaxis=dict(
-            gridcolor='rgba(51, 65, 85, 0.3)',
-            showgrid=True
-        ),
-        yaxis=dict(
-            gridcolor='rgba(51, 65, 85, 0.3)',
-            showgrid=True
-        )
-    )
+def to_ms(seconds):
+    """Seconds as milliseconds rounded for JSON (None stays None)"""
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+def format_duration(seconds):
+    """Seconds as a short human duration, e.g. "2h 5m" """
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {secs}s"
+    return f"{secs}s"
+
+def parse_datetime(value):
+    """ISO datetime from a query argument as naive local time, like the stored timestamps
+    
+    A value with an offset (e.g. ...Z or +02:00) is converted rather than
+    compared with naive times, which would raise TypeError.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def parse_incident_args(args):
+    """get_incidents_page() filters from query arguments, raising ValueError if invalid
+    
+    cursor (from a previous page), site (id), status (changed to), from/to
+    (ISO datetimes) and min_duration (seconds).
+    """
+    filters = {}
+    if args.get('cursor'):
+        started_at, _, incident_id = args['cursor'].rpartition('|')
+        if not started_at:
+            raise ValueError("Invalid cursor")
+        filters['cursor'] = (started_at, int(incident_id))
+    if args.get('site'):
+        filters['site_id'] = int(args['site'])
+    if args.get('status'):
+        if args['status'] not in INCIDENT_STATUSES:
+            raise ValueError(f"status must be one of {', '.join(INCIDENT_STATUSES)}")
+        filters['status'] = args['status']
+    if args.get('from'):
+        filters['since'] = parse_datetime(args['from'])
+    if args.get('to'):
+        filters['until'] = parse_datetime(args['to'])
+    if args.get('min_duration'):
+        filters['min_duration'] = float(args['min_duration'])
+    return filters
+
+def format_cursor(cursor):
+    """Page cursor from get_incidents_page() as a query argument (None stays None)"""
+    return f"{cursor[0]}|{cursor[1]}" if cursor else None
+
+def parse_history_args(args):
+    """(since, until, resolution) from from/to/resolution query arguments, raising ValueError if invalid"""
+    until = parse_datetime(args['to']) if args.get('to') else datetime.now()
+    since = parse_datetime(args['from']) if args.get('from') else until - timedelta(hours=24)
+    if since >= until:
+        raise ValueError("from must be before to")
+    
+    hours = (until - since).total_seconds() / 3600
+    resolution = args.get('resolution', 'auto')
+    if resolution == 'auto':
+        resolution = 'raw' if hours <= AUTO_RAW_MAX_HOURS else ('hour' if hours <= AUTO_HOURLY_MAX_HOURS else 'day')
+    elif resolution not in HISTORY_RESOLUTIONS:
+        raise ValueError(f"resolution must be auto, {', '.join(HISTORY_RESOLUTIONS)}")
+    if resolution == 'raw' and hours > RAW_HISTORY_MAX_HOURS:
+        raise ValueError(f"raw history is limited to {RAW_HISTORY_MAX_HOURS} hours; use hour or day")
     
-    # Convert to HTML
-    chart_html = pio.to_html(fig, include_plotlyjs='cdn', div_id=f'chart-{url}')
-    return chart_html
+    return since, until, resolution
+
+def get_history_columns(url, since, until, resolution):
+    """A site's history as parallel lists (columns) keyed by name
+    
+    raw: t, status, status_code, response_ms per check. hour/day: t, total,
+    up, avg_ms, p95_ms, p95_capped, min_ms, max_ms per rollup bucket, where
+    p95_capped marks p95s slower than the last latency bucket (p95_ms is
+    then a lower bound).
+    """
+    if resolution == 'raw':
+        history = get_site_history(url, since=since, until=until)
+        return {
+            't': [check['timestamp'] for check in history],
+            'status': [check['status'] for check in history],
+            'status_code': [check['status_code'] for check in history],
+            'response_ms': [to_ms(check['response_time']) for check in history],
+        }
+    
+    rollups = get_rollups(url, since, granularity=resolution, until=until)
+    return {
+        't': [bucket['bucket'] for bucket in rollups],
+        'total': [bucket['total_checks'] for bucket in rollups],
+        'up': [bucket['successful_checks'] for bucket in rollups],
+        'avg_ms': [to_ms(bucket['avg_response_time']) for bucket in rollups],
+        'p95_ms': [to_ms(bucket['p95_response_time']) for bucket in rollups],
+        'p95_capped': [bucket['p95_capped'] for bucket in rollups],
+        'min_ms': [to_ms(bucket['min_response_time']) for bucket in rollups],
+        'max_ms': [to_ms(bucket['max_response_time']) for bucket in rollups],
+    }
 
 @app.route('/')
 def index():
+    return cached_page(render_index)
+
+def render_index():
+    """Dashboard page HTML"""
     sites = get_all_sites_status()
     overall_stats = get_overall_stats()
     
@@ -431,6 +567,16 @@ def index():
                 overflow: hidden;
             }
             
+            .chart {
+                min-height: 300px;
+            }
+            
+            .chart-message {
+                color: #64748b;
+                text-align: center;
+                padding-top: 130px;
+            }
+            
             .remove-button {
                 display: inline-block;
                 padding: 8px 16px;
@@ -528,8 +674,6 @@ def index():
         status_class = f"status-{site['status']}"
         status_text = "✓ UP" if site['status'] == 'up' else ("✗ DOWN" if site['status'] == 'down' else "⚠ WARNING")
         
-        chart_html = create_response_time_chart(site['url'])
-        
         html += f"""
         <div class="site-card">
             <div class="site-url">{site['url']}</div>
@@ -557,7 +701,9 @@ def index():
             </div>
             
             <div class="chart-container">
-                {chart_html}
+                <div class="chart" data-site-id="{site['id'] if site['id'] is not None else ''}">
+                    <p class="chart-message">Loading chart...</p>
+                </div>
             </div>
             
             <form method="POST" action="/remove_site" style="margin-top: 15px;">
@@ -567,13 +713,106 @@ def index():
         </div>
         """
     
-    html += """
+    html += f"""
             </div>
             <div class="footer">
                 <p>⚡ Dashboard refreshes automatically every 60 seconds</p>
             </div>
         </div>
         <script>
+            const PLOTLY_JS_URL = '{PLOTLY_JS_URL}';
+        </script>
+    """
+    
+    # Charts are drawn in the browser from /api/sites/<id>/history once their card scrolls into view
+    html += """
+        <script>
+            let plotlyLoading = null;
+            
+            function loadPlotly() {
+                if (!plotlyLoading) {
+                    plotlyLoading = new Promise((resolve, reject) => {
+                        const script = document.createElement('script');
+                        script.src = PLOTLY_JS_URL;
+                        script.onload = resolve;
+                        script.onerror = reject;
+                        document.head.appendChild(script);
+                    });
+                }
+                return plotlyLoading;
+            }
+            
+            function showMessage(chart, text) {
+                chart.innerHTML = `<p class="chart-message">${text}</p>`;
+            }
+            
+            async function drawChart(chart) {
+                if (!chart.dataset.siteId) {
+                    showMessage(chart, 'No data yet');
+                    return;
+                }
+                
+                const response = await fetch(`/api/sites/${chart.dataset.siteId}/history?resolution=hour`);
+                const history = await response.json();
+                if (!history.t.length) {
+                    showMessage(chart, 'No data yet');
+                    return;
+                }
+                
+                // Hours without a successful check have no response time
+                const hours = history.t.map((t, i) => i).filter(i => history.avg_ms[i] !== null);
+                if (!hours.length) {
+                    showMessage(chart, 'No successful checks yet');
+                    return;
+                }
+                
+                await loadPlotly();
+                chart.innerHTML = '';
+                const x = hours.map(i => history.t[i]);
+                Plotly.newPlot(chart, [
+                    {
+                        x: x,
+                        y: hours.map(i => history.avg_ms[i]),
+                        mode: 'lines+markers',
+                        name: 'Avg Response Time',
+                        line: {color: '#4f46e5', width: 2},
+                        marker: {size: 6},
+                        fill: 'tozeroy',
+                        fillcolor: 'rgba(79, 70, 229, 0.1)'
+                    },
+                    {
+                        x: x,
+                        y: hours.map(i => history.p95_ms[i]),
+                        // Past the last latency bucket the p95 is only known to be at least this
+                        text: hours.map(i => (history.p95_capped[i] ? '≥ ' : '~') + history.p95_ms[i] + ' ms'),
+                        hovertemplate: 'p95 %{text}<extra></extra>',
+                        mode: 'lines',
+                        name: 'p95 (approx.)',
+                        line: {color: '#f59e0b', width: 1, dash: 'dot'}
+                    }
+                ], {
+                    title: 'Response Time (Last 24 Hours)',
+                    xaxis: {title: 'Time', gridcolor: 'rgba(51, 65, 85, 0.3)', showgrid: true},
+                    yaxis: {title: 'Response Time (ms)', gridcolor: 'rgba(51, 65, 85, 0.3)', showgrid: true},
+                    plot_bgcolor: 'rgba(15, 23, 42, 0.6)',
+                    paper_bgcolor: 'rgba(0,0,0,0)',
+                    font: {color: '#e2e8f0'},
+                    height: 300,
+                    margin: {l: 50, r: 20, t: 40, b: 40}
+                }, {responsive: true});
+            }
+            
+            // Start loading a little before a card scrolls into view
+            const observer = new IntersectionObserver((entries) => {
+                for (const entry of entries) {
+                    if (entry.isIntersecting) {
+                        observer.unobserve(entry.target);
+                        drawChart(entry.target).catch(() => showMessage(entry.target, 'Chart unavailable'));
+                    }
+                }
+            }, {rootMargin: '200px'});
+            document.querySelectorAll('.chart').forEach(chart => observer.observe(chart));
+            
             setTimeout(() => location.reload(), 60000);
         </script>
     </body>
@@ -584,8 +823,46 @@ def index():
 
 @app.route('/incidents')
 def incidents():
-    """Incident timeline page"""
-    incidents_list = get_all_incidents(hours=168)  # Last 7 days
+    """Incident timeline page, one page of filtered status changes at a time"""
+    try:
+        filters = parse_incident_args(request.args)
+    except ValueError as e:
+        return f"Invalid filter: {html_escape(str(e))}", 400
+    
+    return cached_page(lambda: render_incidents(filters))
+
+def render_filter_form(args):
+    """Timeline filter form HTML, showing the current filters"""
+    def option(value, label, selected):
+        return f'<option value="{html_escape(str(value))}"{" selected" if selected else ""}>{html_escape(label)}</option>'
+    
+    sites = load_sites()
+    site_ids = get_site_ids(sites)
+    site_options = option('', 'All sites', False) + ''.join(
+        option(site_ids[url], url, str(site_ids[url]) == args.get('site')) for url in sites if url in site_ids
+    )
+    status_options = option('', 'Any status', False) + ''.join(
+        option(status, f"Changed to {status}", status == args.get('status')) for status in INCIDENT_STATUSES
+    )
+    duration_options = option('', 'Any duration', False) + ''.join(
+        option(seconds, f"At least {label}", str(seconds) == args.get('min_duration')) for seconds, label in MIN_DURATION_CHOICES
+    )
+    
+    return f"""
+            <form method="GET" action="/incidents" class="filters">
+                <select name="site">{site_options}</select>
+                <select name="status">{status_options}</select>
+                <select name="min_duration">{duration_options}</select>
+                <input type="datetime-local" name="from" value="{html_escape(args.get('from', ''))}" title="From">
+                <input type="datetime-local" name="to" value="{html_escape(args.get('to', ''))}" title="To">
+                <button type="submit">Filter</button>
+                <a href="/incidents">Reset</a>
+            </form>
+    """
+
+def render_incidents(filters):
+    """Incident timeline page HTML for one page of get_incidents_page(**filters)"""
+    incidents_list, next_cursor = get_incidents_page(limit=INCIDENTS_PAGE_SIZE, **filters)
     
     html = """
     <!DOCTYPE html>
@@ -707,6 +984,12 @@ def incidents():
                 border-radius: 8px;
             }
             
+            .incident-detail {
+                color: #94a3b8;
+                font-size: 0.9rem;
+                margin-top: 10px;
+            }
+            
             .status-badge {
                 display: inline-block;
                 padding: 4px 10px;
@@ -737,14 +1020,54 @@ def incidents():
                 color: #64748b;
                 font-size: 1.2rem;
             }
+            
+            .filters {
+                display: flex;
+                flex-wrap: wrap;
+                gap: 10px;
+                justify-content: center;
+                margin-bottom: 40px;
+            }
+            
+            .filters select, .filters input, .filters button {
+                padding: 8px 12px;
+                background: rgba(30, 41, 59, 0.8);
+                color: #e2e8f0;
+                border: 1px solid #334155;
+                border-radius: 8px;
+                font-size: 0.9rem;
+            }
+            
+            .filters select {
+                max-width: 280px;
+            }
+            
+            .filters button {
+                background: rgba(79, 70, 229, 0.6);
+                cursor: pointer;
+            }
+            
+            .filters a, .pagination a {
+                color: #a5b4fc;
+                align-self: center;
+            }
+            
+            .pagination {
+                display: flex;
+                justify-content: space-between;
+                margin-top: 30px;
+            }
         </style>
     </head>
     <body>
         <div class="container">
             <a href="/" class="back-link">← Back to Dashboard</a>
             <h1>📅 Incident Timeline</h1>
-            <p style="text-align: center; color: #94a3b8; margin-bottom: 40px;">Last 7 days of status changes</p>
-            
+            <p style="text-align: center; color: #94a3b8; margin-bottom: 30px;">Status changes, newest first</p>
+    """
+    
+    html += render_filter_form(request.args)
+    html += """
             <div class="timeline">
     """
     
@@ -764,6 +1087,16 @@ def incidents():
             from_text = incident['from_status'].upper()
             to_text = incident['to_status'].upper()
             
+            # How long the new state lasted, and what caused a failure
+            if incident['duration'] is None:
+                detail = "Ongoing"
+            else:
+                detail = f"Lasted {format_duration(incident['duration'])}"
+            if incident['to_status'] != 'up':
+                cause = incident['error'] or (f"HTTP {incident['status_code']}" if incident['status_code'] else None)
+                if cause:
+                    detail += f" · {html_escape(cause)}"
+            
             html += f"""
             <div class="incident {incident_class}">
                 <div class="incident-time">{incident['timestamp']}</div>
@@ -774,16 +1107,30 @@ def incidents():
                     →
                     <span class="status-badge {to_badge_class}">{to_text}</span>
                 </div>
+                <div class="incident-detail">{detail}</div>
             </div>
             """
     else:
         html += """
         <div class="no-incidents">
-            <p>🎉 No incidents in the last 7 days!</p>
-            <p style="margin-top: 10px; font-size: 1rem;">All monitored sites have been stable.</p>
+            <p>🎉 No incidents here!</p>
+            <p style="margin-top: 10px; font-size: 1rem;">No status changes match these filters.</p>
         </div>
         """
     
+    html += """
+            </div>
+            <div class="pagination">
+    """
+    
+    # Newer pages are a fresh look from the top; older ones continue from the cursor
+    if 'cursor' in filters:
+        html += f"""<a href="/incidents?{html_escape(urlencode({name: value for name, value in request.args.items() if name != 'cursor'}))}">← Newest</a>"""
+    else:
+        html += "<span></span>"
+    if next_cursor:
+        html += f"""<a href="/incidents?{html_escape(urlencode({**request.args.to_dict(), 'cursor': format_cursor(next_cursor)}))}">Older →</a>"""
+    
     html += """
             </div>
         </div>
@@ -793,6 +1140,81 @@ def incidents():
     
     return html
 
+@app.route('/api/sites')
+def api_sites():
+    """Every monitored site's current status, as columns"""
+    def build():
+        sites = get_all_sites_status()
+        return {
+            'id': [site['id'] for site in sites],
+            'url': [site['url'] for site in sites],
+            'status': [site['status'] for site in sites],
+            'uptime': [round(site['uptime'], 2) for site in sites],
+            'total_checks': [site['total_checks'] for site in sites],
+            'avg_response_ms': [to_ms(site['avg_response']) for site in sites],
+            'last_checked': [site['last_checked'] for site in sites]
+        }
+    
+    return conditional_json(build)
+
+@app.route('/api/sites/<int:site_id>/history')
+def api_site_history(site_id):
+    """One site's history between from and to (ISO datetimes, default the last 24 hours)
+    
+    resolution is raw (every check), hour or day (rollups), or auto to pick
+    by the length of the range.
+    """
+    url = get_site_url(site_id)
+    if url is None:
+        return jsonify({'error': f"No site with id {site_id}"}), 404
+    
+    try:
+        since, until, resolution = parse_history_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        return {
+            'site_id': site_id,
+            'url': url,
+            'from': since.isoformat(),
+            'to': until.isoformat(),
+            'resolution': resolution,
+            **get_history_columns(url, since, until, resolution)
+        }
+    
+    return conditional_json(build)
+
+@app.route('/api/incidents')
+def api_incidents():
+    """One page of status changes, newest first, as columns
+    
+    Takes the timeline's filters (site, status, from, to, min_duration) and
+    limit; pass next_cursor back as cursor for the next, older page.
+    """
+    try:
+        filters = parse_incident_args(request.args)
+        limit = min(max(int(request.args.get('limit', INCIDENTS_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        incidents_list, next_cursor = get_incidents_page(limit=limit, **filters)
+        return {
+            'next_cursor': format_cursor(next_cursor),
+            'id': [incident['id'] for incident in incidents_list],
+            'url': [incident['url'] for incident in incidents_list],
+            'timestamp': [incident['timestamp'] for incident in incidents_list],
+            'from_status': [incident['from_status'] for incident in incidents_list],
+            'to_status': [incident['to_status'] for incident in incidents_list],
+            'status_code': [incident['status_code'] for incident in incidents_list],
+            'error': [incident['error'] for incident in incidents_list],
+            'ended_at': [incident['ended_at'] for incident in incidents_list],
+            'duration': [incident['duration'] for incident in incidents_list]
+        }
+    
+    return conditional_json(build)
+
 @app.route('/add_site', methods=['POST'])
 def add_site_route():
     """Add a new site via form submission"""
@@ -819,7 +1241,7 @@ def remove_site_route():
 
 @app.route('/download_report')
 def download_report():
-    """Generate and download PDF report with optional date range"""
+    """Download a PDF report of the last days (default 7), generated in the background"""
     # Get optional days parameter (default: 7 days)
     days = request.args.get('days', 7, type=int)
     
@@ -829,20 +1251,141 @@ def download_report():
     if days > 365:
         days = 365
     
-    # Generate PDF
-    pdf_data = generate_uptime_report(days=days)
-    
-    # Create filename with timestamp and period
-    filename = f"uptime_report_{days}days_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    # Pre-built daily/weekly reports from the latest run go out straight away
+    job = report_jobs.latest_scheduled(days) if days in SCHEDULED_REPORTS else None
+    if job is not None:
+        return send_report(job)
     
-    # Return PDF as download
+    job = report_jobs.submit(days)
+    return redirect(f'/reports/{job.id}')
+
+def send_report(job):
+    """Send a finished report job's PDF as a download"""
     return send_file(
-        io.BytesIO(pdf_data),
+        os.path.abspath(job.path),
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=filename
+        download_name=job.filename
     )
 
+@app.route('/reports/<job_id>')
+def report_status(job_id):
+    """Progress page of a report job, which starts the download when it's done"""
+    job = report_jobs.get(job_id)
+    if job is None:
+        return "Report not found (it may have expired)", 404
+    
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <title>Preparing Report - Site Monitor</title>
+        <style>
+            body {{
+                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+                background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%);
+                color: #e2e8f0;
+                padding: 80px 20px;
+                min-height: 100vh;
+                margin: 0;
+                text-align: center;
+            }}
+            
+            .progress {{
+                max-width: 500px;
+                height: 16px;
+                margin: 30px auto;
+                background: rgba(30, 41, 59, 0.8);
+                border: 1px solid #334155;
+                border-radius: 8px;
+                overflow: hidden;
+            }}
+            
+            .progress-bar {{
+                height: 100%;
+                width: 0;
+                background: linear-gradient(135deg, #4f46e5 0%, #7c3aed 100%);
+                transition: width 0.5s;
+            }}
+            
+            a {{
+                color: #a5b4fc;
+            }}
+        </style>
+    </head>
+    <body>
+        <h1>📄 Preparing your {job.days}-day report</h1>
+        <div class="progress"><div class="progress-bar" id="bar"></div></div>
+        <p id="message">Waiting to start...</p>
+        <p style="margin-top: 40px;"><a href="/">← Back to Dashboard</a></p>
+        <script>
+            async function poll() {{
+                const job = await (await fetch('/api/reports/{job.id}')).json();
+                document.getElementById('bar').style.width = `${{job.progress * 100}}%`;
+                if (job.status === 'done') {{
+                    document.getElementById('message').innerHTML = `Done. <a href="${{job.download_url}}">Download again</a>`;
+                    location.href = job.download_url;
+                    return;
+                }}
+                if (job.status === 'failed') {{
+                    document.getElementById('message').textContent = `Report failed: ${{job.error}}`;
+                    return;
+                }}
+                document.getElementById('message').textContent =
+                    job.status === 'running' ? `Rendering... ${{Math.round(job.progress * 100)}}%` : 'Waiting to start...';
+                setTimeout(poll, 1000);
+            }}
+            poll();
+        </script>
+    </body>
+    </html>
+    """
+
+@app.route('/reports/<job_id>/download')
+def report_download(job_id):
+    """A finished report job's PDF"""
+    job = report_jobs.get(job_id)
+    if job is None or job.status != 'done':
+        return "Report not found or not finished", 404
+    return send_report(job)
+
+@app.route('/api/reports', methods=['POST'])
+def api_submit_report():
+    """Start (or join) a report job: days (default 7) and optional site ids; returns the job to poll"""
+    data = request.get_json(silent=True)
+    if data is None:
+        data = request.form
+    elif not isinstance(data, dict):
+        return jsonify({'error': "Request body must be a JSON object"}), 400
+    try:
+        days = int(data.get('days', 7))
+        site_ids = data.getlist('site') if hasattr(data, 'getlist') else data.get('sites')
+        if site_ids is not None and not isinstance(site_ids, list):
+            raise TypeError("sites must be a list")
+        sites = [get_site_url(int(site_id)) for site_id in site_ids] if site_ids else None
+    except (TypeError, ValueError):
+        return jsonify({'error': "days and sites must be integers"}), 400
+    if not 1 <= days <= 365:
+        return jsonify({'error': "days must be between 1 and 365"}), 400
+    if sites is not None and None in sites:
+        return jsonify({'error': "Unknown site id"}), 400
+    
+    job = report_jobs.submit(days, sites)
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/reports/<job_id>')
+def api_report_status(job_id):
+    """Status and progress of a report job"""
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f"No report job {job_id}"}), 404
+    return jsonify(job.to_dict())
+
 if __name__ == '__main__':
+    init_database()
+    # Pre-build the scheduled reports in the serving process, not the debug reloader's watcher
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        report_jobs.start()
     print("Starting server...")
     app.run(debug=True, port=5001)
\ No newline at end of file